@@ -0,0 +1,102 @@
+"""
+Shared embedding server
+
+One process owns the embedding model and serves every API worker, so the
+model is loaded once instead of once per uvicorn worker, and concurrent
+requests from all workers are micro-batched into single encode calls.
+
+Usage:
+    python -m app.embedding_server
+
+Listens on EMBEDDING_SERVER_SOCKET (a Unix socket path) if set, otherwise on
+EMBEDDING_SERVER_HOST:EMBEDDING_SERVER_PORT. Point the API at it with
+EMBEDDING_SERVER_URL=unix:///path/to.sock (or http://host:port).
+Always run it with a single worker.
+"""
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field
+from typing import List
+import os
+import numpy as np
+from dotenv import load_dotenv
+
+from app.services.embedding_service import EmbeddingService
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.utils import metrics
+
+load_dotenv()
+
+# Always run inference in this process, even if EMBEDDING_SERVER_URL is set
+service = EmbeddingService(server_url="")
+batcher = EmbeddingBatcher(service.encode, executor=service.executor)
+
+app = FastAPI(title="Study Buddy Embedding Server")
+
+
+class EmbedRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1, max_length=4096)
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Load the model and start the batching loop"""
+    service.start_warm_up()
+    batcher.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await batcher.stop()
+
+
+@app.post("/embed")
+async def embed(request: EmbedRequest):
+    """Embed texts; the body is the float32 matrix in row-major order"""
+    embeddings = np.asarray(await batcher.embed(request.texts), dtype=np.float32)
+    return Response(
+        content=embeddings.tobytes(),
+        media_type="application/octet-stream",
+        headers={
+            "X-Embedding-Dimension": str(embeddings.shape[1]),
+            "X-Embedding-Model": service.model_id,
+        },
+    )
+
+
+@app.get("/health")
+def health():
+    """Readiness of the model"""
+    if not service.is_ready:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "loading", "model_id": service.model_id},
+        )
+    return {
+        "status": "ready",
+        "model_id": service.model_id,
+        "dimension": service.get_embedding_dimension(),
+    }
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Batch-size and queue-wait histograms in the Prometheus text format"""
+    return PlainTextResponse(
+        metrics.registry.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    socket_path = os.getenv("EMBEDDING_SERVER_SOCKET")
+    if socket_path:
+        uvicorn.run(app, uds=socket_path, workers=1)
+    else:
+        uvicorn.run(
+            app,
+            host=os.getenv("EMBEDDING_SERVER_HOST", "127.0.0.1"),
+            port=int(os.getenv("EMBEDDING_SERVER_PORT", "8100")),
+            workers=1,
+        )
@@ -1,13 +1,52 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from anyio import to_thread
+from sqlalchemy import text
 from fastapi.middleware.cors import CORSMiddleware
+import time
 import os
 from dotenv import load_dotenv
 
-from app.models.database import init_db
+from app.models.database import engine, init_db, pool_status
 from app.routers import auth, users, documents, query
+from app.services.ingestion_service import ingestion_service
+from app.services.rag_service import rag_service
+from app.services.document_processor import shutdown_pdf_pool
+from app.services.embedding_service import embedding_service
+from app.services.reranker_service import reranker_service
+from app.services.context_packer import context_packer
+from app.utils import metrics
+from app.utils.password_hasher import password_hasher
+from app.utils.timing import StageTimings, request_timings
 
 load_dotenv()
 
+# Debug aid: return per-stage timings of each request in a Server-Timing
+# header (streamed responses only include stages finished before the first byte)
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "false").lower() == "true"
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency until the response starts",
+    labelnames=("method", "route", "status"),
+)
+
+# Database pool usage, read when /metrics is scraped
+metrics.gauge(
+    "db_pool_connections",
+    "Pooled database connections by state",
+    labelnames=("state",),
+    callback=lambda: {
+        (state,): pool_status().get(state, 0)
+        for state in ("checked_out", "idle", "overflow")
+    },
+)
+metrics.gauge(
+    "db_pool_utilization",
+    "Checked-out connections as a fraction of pool size plus overflow",
+    callback=lambda: {(): pool_status().get("utilization", 0.0)},
+)
+
 # Create FastAPI app
 app = FastAPI(
     title="Study Buddy RAG API",
@@ -22,8 +61,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
 )
 
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Time each request and collect the stage timings recorded while handling it"""
+    timings = StageTimings()
+    token = request_timings.set(timings)
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        elapsed = time.perf_counter() - started
+        request_timings.reset(token)
+        # Label by route template, not the raw path, to bound cardinality
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            elapsed,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status_code),
+        )
+
+    if SERVER_TIMING_HEADER:
+        timings.add("total", elapsed)
+        response.headers["Server-Timing"] = timings.server_timing()
+    return response
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(users.router)
@@ -34,9 +102,44 @@ app.include_router(query.router)
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup"""
+    # Sync route handlers and dependencies run on this threadpool
+    to_thread.current_default_thread_limiter().total_tokens = int(
+        os.getenv("THREADPOOL_WORKERS", "40")
+    )
+
     init_db()
     print("Database initialized")
 
+    # Refuse to serve with a shared embedding server running another model
+    embedding_service.verify_server_model()
+
+    ingestion_service.start()
+    recovered = ingestion_service.recover_pending()
+    if recovered:
+        print(f"Re-queued {recovered} pending document(s) for ingestion")
+
+    # Load the embedding model in the background; /health/ready reports
+    # when it is done
+    if os.getenv("EMBEDDING_WARMUP", "true").lower() == "true":
+        embedding_service.start_warm_up()
+        # tiktoken fetches its BPE files on first use; do it before the
+        # first query needs them
+        context_packer.start_warm_up(
+            [rag_service.default_model, *context_packer.budgets]
+        )
+        if reranker_service.enabled:
+            reranker_service.start_warm_up()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers and close pooled connections"""
+    ingestion_service.shutdown()
+    shutdown_pdf_pool()
+    password_hasher.shutdown()
+    await embedding_service.aclose()
+    await rag_service.aclose()
+
 
 @app.get("/")
 async def root():
@@ -50,10 +153,36 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Liveness check: the process is up and serving requests"""
     return {"status": "healthy"}
 
 
+@app.get("/health/ready")
+def readiness_check():
+    """Readiness check: the database is reachable and the embedding model is loaded"""
+    checks = {"embedding_model": embedding_service.is_ready}
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        checks["database"] = True
+    except Exception:
+        checks["database"] = False
+
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "checks": checks},
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    """Process metrics in the Prometheus text format"""
+    return PlainTextResponse(
+        metrics.registry.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,106 @@
+"""
+Administrative commands
+
+Usage:
+    python -m app.manage init-db
+    python -m app.manage rebuild-index
+    python -m app.manage embedding-parity --backend onnx
+    python -m app.manage embedding-benchmark --backends torch,torch-int8,onnx
+"""
+import argparse
+import json
+import os
+
+from app.models.database import init_db, rebuild_vector_index, VECTOR_INDEX_TYPE
+
+
+def cmd_init_db(args):
+    """Create tables, apply all migrations (including table rewrites) and build the vector index"""
+    init_db(wait=True, rewrite_tables=True)
+    print("Database initialized")
+
+
+def cmd_rebuild_index(args):
+    """Rebuild the vector index after bulk loads or a change of its configuration"""
+    rebuild_vector_index()
+    if VECTOR_INDEX_TYPE == "none":
+        print("Vector index disabled (VECTOR_INDEX_TYPE=none)")
+    else:
+        print(f"Rebuilt {VECTOR_INDEX_TYPE} vector index")
+
+
+SAMPLE_TEXTS = [
+    "Summarize chapter 3",
+    "What is the difference between mitosis and meiosis?",
+    "Explain the time complexity of quicksort in the average and worst case.",
+    "The Krebs cycle takes place in the mitochondrial matrix and produces NADH and FADH2.",
+    "Define opportunity cost and give an example from the lecture notes.",
+    "CS 101 midterm topics: recursion, big-O notation, linked lists and hash tables.",
+    "Newton's second law states that force equals mass times acceleration.",
+    "List the main causes of the French Revolution discussed in week 5.",
+]
+
+
+def load_texts(args):
+    """Texts for embedding comparisons: a file (one per line) or built-in samples"""
+    if args.texts_file:
+        with open(args.texts_file, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = SAMPLE_TEXTS
+    # Repeat to the requested size so throughput numbers are meaningful
+    return (texts * (args.count // len(texts) + 1))[: max(args.count, 1)]
+
+
+def cmd_embedding_parity(args):
+    """Report cosine drift of an embedding backend against the torch reference"""
+    from app.services.embedding_backends import create_backend, parity_check
+
+    model_name = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    reference = create_backend("torch", model_name)
+    backend = create_backend(args.backend, model_name)
+    print(json.dumps(parity_check(backend, reference, load_texts(args)), indent=2))
+
+
+def cmd_embedding_benchmark(args):
+    """Compare embedding throughput across backends"""
+    from app.services.embedding_backends import benchmark, create_backend
+
+    model_name = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    texts = load_texts(args)
+    for name in args.backends.split(","):
+        backend = create_backend(name.strip(), model_name)
+        print(json.dumps(benchmark(backend, texts, args.batch_size, args.repeats)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("init-db", help=cmd_init_db.__doc__).set_defaults(
+        func=cmd_init_db
+    )
+    subparsers.add_parser("rebuild-index", help=cmd_rebuild_index.__doc__).set_defaults(
+        func=cmd_rebuild_index
+    )
+
+    parity = subparsers.add_parser("embedding-parity", help=cmd_embedding_parity.__doc__)
+    parity.add_argument("--backend", required=True)
+    parity.add_argument("--texts-file")
+    parity.add_argument("--count", type=int, default=256)
+    parity.set_defaults(func=cmd_embedding_parity)
+
+    bench = subparsers.add_parser("embedding-benchmark", help=cmd_embedding_benchmark.__doc__)
+    bench.add_argument("--backends", default="torch,torch-int8,onnx,onnx-int8")
+    bench.add_argument("--texts-file")
+    bench.add_argument("--count", type=int, default=512)
+    bench.add_argument("--batch-size", type=int, default=None)
+    bench.add_argument("--repeats", type=int, default=3)
+    bench.set_defaults(func=cmd_embedding_benchmark)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
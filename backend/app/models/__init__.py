@@ -1,5 +1,5 @@
-from app.models.database import Base, get_db, init_db
+from app.models.database import Base, get_db, init_db, rebuild_vector_index
 from app.models.user import User
 from app.models.document import Document, DocumentChunk
 
-__all__ = ["Base", "get_db", "init_db", "User", "Document", "DocumentChunk"]
+__all__ = ["Base", "get_db", "init_db", "rebuild_vector_index", "User", "Document", "DocumentChunk"]
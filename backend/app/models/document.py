@@ -1,9 +1,14 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, BigInteger
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, BigInteger, Computed, Index
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 from app.models.database import Base
 from pgvector.sqlalchemy import Vector
 
+# Text search configuration of the chunk_tsv column; queries must use the
+# same configuration for the GIN index to apply
+TEXT_SEARCH_CONFIG = "english"
+
 
 class Document(Base):
     __tablename__ = "documents"
@@ -16,11 +21,33 @@ class Document(Base):
     file_size = Column(BigInteger, nullable=False)  # in bytes
     upload_date = Column(DateTime, default=datetime.utcnow)
     processed = Column(Integer, default=0)  # 0: pending, 1: processing, 2: completed, -1: failed
+    # Rows in document_chunks for this document, maintained by ingestion so
+    # listings don't count chunks per document
+    chunk_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+    # Ingestion progress (maintained by the background ingestion workers)
+    chunks_total = Column(Integer, nullable=True)
+    chunks_processed = Column(Integer, default=0)
+    # PDF page progress; the page count is known before chunking finishes
+    pages_total = Column(Integer, nullable=True)
+    pages_processed = Column(Integer, nullable=True)
+    processing_error = Column(Text, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # last progress update from a worker
+
+    # Deduplication: SHA-256 of the uploaded bytes, and of the chunking and
+    # embedding configuration the chunks were produced with
+    content_hash = Column(String(64), nullable=True, index=True)
+    ingest_signature = Column(String(64), nullable=True)
 
     # Relationships
     owner = relationship("User", back_populates="documents")
     chunks = relationship("DocumentChunk", back_populates="document", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Keyset pagination of a user's documents, newest first
+        Index("ix_documents_user_upload_date", "user_id", upload_date.desc(), id.desc()),
+    )
+
     def __repr__(self):
         return f"<Document(filename='{self.filename}', user_id={self.user_id})>"
 
@@ -37,11 +64,27 @@ class DocumentChunk(Base):
 
     # Vector embedding (384 dimensions for all-MiniLM-L6-v2)
     embedding = Column(Vector(384), nullable=True)
+    # SHA-256 of the embedding model id and chunk text; lets identical chunks
+    # of other documents reuse this embedding
+    content_hash = Column(String(64), nullable=True, index=True)
+
+    # Full-text search vector for lexical/hybrid retrieval (maintained by
+    # PostgreSQL; deferred so ORM loads of chunks don't fetch it)
+    chunk_tsv = deferred(
+        Column(
+            TSVECTOR,
+            Computed(f"to_tsvector('{TEXT_SEARCH_CONFIG}', chunk_text)", persisted=True),
+        )
+    )
 
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
     document = relationship("Document", back_populates="chunks")
 
+    __table_args__ = (
+        Index("ix_document_chunks_chunk_tsv", "chunk_tsv", postgresql_using="gin"),
+    )
+
     def __repr__(self):
         return f"<DocumentChunk(doc_id={self.document_id}, chunk_index={self.chunk_index})>"
@@ -1,54 +1,63 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from app.models.database import get_db
 from app.models.user import User
 from app.schemas.user import UserCreate, UserLogin, UserResponse, Token
 from app.utils.auth import (
-    get_password_hash,
     create_access_token,
     authenticate_user,
-    get_current_user,
+    get_cached_user,
 )
+from app.utils.password_hasher import password_hasher
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     """Register a new user"""
-    # Check if username already exists
-    existing_user = (
-        db.query(User).filter(User.username == user_data.username).first()
-    )
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already registered",
-        )
-
-    # Check if email already exists
-    if user_data.email:
-        existing_email = (
-            db.query(User).filter(User.email == user_data.email).first()
+    # Database calls run on the threadpool; bcrypt runs on the password
+    # hashing pool, which answers 429 when it is saturated
+    def check_existing():
+        # Check if username already exists
+        existing_user = (
+            db.query(User).filter(User.username == user_data.username).first()
         )
-        if existing_email:
+        if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email already registered",
+                detail="Username already registered",
             )
 
+        # Check if email already exists
+        if user_data.email:
+            existing_email = (
+                db.query(User).filter(User.email == user_data.email).first()
+            )
+            if existing_email:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Email already registered",
+                )
+
+    await run_in_threadpool(check_existing)
+
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await password_hasher.hash(user_data.password)
     new_user = User(
         username=user_data.username,
         email=user_data.email,
         hashed_password=hashed_password,
     )
 
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    def save():
+        db.add(new_user)
+        db.commit()
+        db.refresh(new_user)
+
+    await run_in_threadpool(save)
 
     # Prepare response
     response = UserResponse(
@@ -67,9 +76,9 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=Token)
-def login(user_data: UserLogin, db: Session = Depends(get_db)):
+async def login(user_data: UserLogin, db: Session = Depends(get_db)):
     """Login and receive JWT token"""
-    user = authenticate_user(db, user_data.username, user_data.password)
+    user = await authenticate_user(db, user_data.username, user_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -83,7 +92,7 @@ def login(user_data: UserLogin, db: Session = Depends(get_db)):
 
 
 @router.get("/me", response_model=UserResponse)
-async def get_me(current_user: User = Depends(get_current_user)):
+async def get_me(current_user: User = Depends(get_cached_user)):
     """Get current user information"""
     return UserResponse(
         id=current_user.id,
@@ -1,25 +1,58 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from sqlalchemy import func, tuple_
+from datetime import datetime
+from typing import List, Optional, Tuple
+import base64
+import hashlib
 import os
-import shutil
 from pathlib import Path
 
 from app.models.database import get_db
-from app.models.user import User
-from app.models.document import Document, DocumentChunk
-from app.schemas.document import DocumentResponse
-from app.utils.auth import get_current_user
-from app.services.document_processor import DocumentProcessor
-from app.services.embedding_service import embedding_service
-
+from app.models.document import Document
+from app.schemas.document import DocumentResponse, DocumentStatusResponse
+from app.utils.auth import get_current_user_id
+from app.services.ingestion_service import ingestion_service
+from app.services.answer_cache import answer_cache
+from app.utils import metrics
+from app.utils.timing import stage
+
+# Handlers are plain `def` so FastAPI runs their blocking DB and file I/O on
+# its threadpool instead of the event loop. They only need the user id, which
+# comes from the token without a users lookup.
 router = APIRouter(prefix="/documents", tags=["Documents"])
 
 # Configuration
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
 MAX_UPLOAD_SIZE_MB = int(os.getenv("MAX_UPLOAD_SIZE_MB", "100"))
 MAX_UPLOAD_SIZE_BYTES = MAX_UPLOAD_SIZE_MB * 1024 * 1024
+UPLOAD_BLOCK_SIZE = 1024 * 1024  # bytes read per write/hash step while saving
+
+PROCESSING_STATUS_LABELS = {
+    0: "pending",
+    1: "processing",
+    2: "completed",
+    -1: "failed",
+}
+
+# Columns needed for DocumentResponse; listings select only these
+DOCUMENT_RESPONSE_COLUMNS = (
+    Document.id,
+    Document.user_id,
+    Document.filename,
+    Document.file_type,
+    Document.file_size,
+    Document.upload_date,
+    Document.processed,
+    Document.chunk_count,
+)
+
+UPLOAD_STAGE_SECONDS = metrics.histogram(
+    "upload_stage_seconds",
+    "Time spent per upload request stage (validate, save, record); "
+    "extraction and embedding are in ingestion_stage_seconds",
+    labelnames=("stage",),
+)
 
 # Ensure upload directory exists
 Path(UPLOAD_DIR).mkdir(parents=True, exist_ok=True)
@@ -38,13 +71,31 @@ def get_file_type(filename: str) -> str:
         raise ValueError(f"Unsupported file type: {extension}")
 
 
-@router.post("/upload", response_model=DocumentResponse, status_code=status.HTTP_201_CREATED)
-async def upload_document(
-    file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-):
-    """Upload and process a document"""
+def encode_cursor(upload_date: datetime, document_id: int) -> str:
+    """Opaque keyset cursor for the position after a document"""
+    raw = f"{upload_date.isoformat()}|{document_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor"""
+    try:
+        upload_date, document_id = (
+            base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        )
+        return datetime.fromisoformat(upload_date), int(document_id)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+
+
+def validate_upload(file: UploadFile, user_id: int, db: Session) -> Tuple[int, str]:
+    """
+    Check an upload against the size limits and supported file types
+    Returns: (file size in bytes, file type)
+    """
     # Validate file size
     file.file.seek(0, 2)  # Seek to end
     file_size = file.file.tell()
@@ -59,7 +110,7 @@ async def upload_document(
     # Check user's total storage
     user_total_storage = (
         db.query(func.sum(Document.file_size))
-        .filter(Document.user_id == current_user.id)
+        .filter(Document.user_id == user_id)
         .scalar()
         or 0
     )
@@ -80,75 +131,78 @@ async def upload_document(
             detail=str(e),
         )
 
+    return file_size, file_type
+
+
+def save_upload(file: UploadFile, user_id: int, db: Session) -> Tuple[str, str]:
+    """
+    Write an upload to the user's directory, hashing it on the way so
+    identical uploads can reuse the chunks and embeddings of an earlier copy
+    Returns: (file path, SHA-256 of the content)
+    """
     # Create user directory
-    user_dir = os.path.join(UPLOAD_DIR, str(current_user.id))
+    user_dir = os.path.join(UPLOAD_DIR, str(user_id))
     Path(user_dir).mkdir(parents=True, exist_ok=True)
 
-    # Save file
+    # Re-uploading a filename overwrites the stored file, so answers cached
+    # from earlier versions of it are dropped
+    previous_versions = (
+        db.query(Document.id)
+        .filter(Document.user_id == user_id, Document.filename == file.filename)
+        .all()
+    )
+    for (previous_id,) in previous_versions:
+        answer_cache.invalidate_document(user_id, previous_id)
+
     file_path = os.path.join(user_dir, file.filename)
+    hasher = hashlib.sha256()
     try:
         with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+            while True:
+                block = file.file.read(UPLOAD_BLOCK_SIZE)
+                if not block:
+                    break
+                hasher.update(block)
+                buffer.write(block)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error saving file: {str(e)}",
         )
 
-    # Create document record
-    document = Document(
-        user_id=current_user.id,
-        filename=file.filename,
-        file_path=file_path,
-        file_type=file_type,
-        file_size=file_size,
-        processed=1,  # Processing
-    )
+    return file_path, hasher.hexdigest()
 
-    db.add(document)
-    db.commit()
-    db.refresh(document)
 
-    # Process document in background (for production, use Celery or similar)
-    try:
-        processor = DocumentProcessor()
-        chunks = processor.process_document(file_path, file_type)
-
-        # Generate embeddings and store chunks
-        for chunk_text, page_num, chunk_idx in chunks:
-            # Generate embedding
-            embedding = embedding_service.embed_text(chunk_text)
-
-            # Create chunk
-            chunk = DocumentChunk(
-                document_id=document.id,
-                user_id=current_user.id,
-                chunk_index=chunk_idx,
-                chunk_text=chunk_text,
-                page_number=page_num,
-                embedding=embedding,
-            )
-            db.add(chunk)
-
-        # Update document status
-        document.processed = 2  # Completed
-        db.commit()
+@router.post("/upload", response_model=DocumentResponse, status_code=status.HTTP_202_ACCEPTED)
+def upload_document(
+    file: UploadFile = File(...),
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    """Upload a document and queue it for processing"""
+    with stage(UPLOAD_STAGE_SECONDS, "validate"):
+        file_size, file_type = validate_upload(file, user_id, db)
+
+    with stage(UPLOAD_STAGE_SECONDS, "save"):
+        file_path, content_hash = save_upload(file, user_id, db)
+
+    # Create document record; extraction and embedding run in the background
+    with stage(UPLOAD_STAGE_SECONDS, "record"):
+        document = Document(
+            user_id=user_id,
+            filename=file.filename,
+            file_path=file_path,
+            file_type=file_type,
+            file_size=file_size,
+            content_hash=content_hash,
+            processed=0,  # Pending
+        )
 
-    except Exception as e:
-        # Mark as failed
-        document.processed = -1
+        db.add(document)
         db.commit()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error processing document: {str(e)}",
-        )
+        db.refresh(document)
 
-    # Get chunk count
-    chunk_count = (
-        db.query(DocumentChunk)
-        .filter(DocumentChunk.document_id == document.id)
-        .count()
-    )
+    ingestion_service.enqueue(document.id)
 
     return DocumentResponse(
         id=document.id,
@@ -158,56 +212,64 @@ async def upload_document(
         file_size=document.file_size,
         upload_date=document.upload_date,
         processed=document.processed,
-        chunk_count=chunk_count,
+        chunk_count=0,
     )
 
 
 @router.get("/", response_model=List[DocumentResponse])
-async def list_documents(
-    current_user: User = Depends(get_current_user),
+def list_documents(
+    response: Response,
+    limit: int = Query(default=100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db),
 ):
-    """List all documents for the current user"""
-    documents = (
-        db.query(Document)
-        .filter(Document.user_id == current_user.id)
-        .order_by(Document.upload_date.desc())
+    """
+    List the current user's documents, newest first. When more remain, the
+    X-Next-Cursor response header holds the cursor for the next page.
+    """
+    query = db.query(*DOCUMENT_RESPONSE_COLUMNS).filter(Document.user_id == user_id)
+    if cursor:
+        upload_date, document_id = decode_cursor(cursor)
+        query = query.filter(
+            tuple_(Document.upload_date, Document.id) < tuple_(upload_date, document_id)
+        )
+
+    # One extra row tells whether there is a next page
+    rows = (
+        query.order_by(Document.upload_date.desc(), Document.id.desc())
+        .limit(limit + 1)
         .all()
     )
-
-    response = []
-    for doc in documents:
-        chunk_count = (
-            db.query(DocumentChunk)
-            .filter(DocumentChunk.document_id == doc.id)
-            .count()
-        )
-        response.append(
-            DocumentResponse(
-                id=doc.id,
-                user_id=doc.user_id,
-                filename=doc.filename,
-                file_type=doc.file_type,
-                file_size=doc.file_size,
-                upload_date=doc.upload_date,
-                processed=doc.processed,
-                chunk_count=chunk_count,
-            )
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].upload_date, rows[-1].id)
+
+    return [
+        DocumentResponse(
+            id=row.id,
+            user_id=row.user_id,
+            filename=row.filename,
+            file_type=row.file_type,
+            file_size=row.file_size,
+            upload_date=row.upload_date,
+            processed=row.processed,
+            chunk_count=row.chunk_count,
         )
-
-    return response
+        for row in rows
+    ]
 
 
 @router.get("/{document_id}", response_model=DocumentResponse)
-async def get_document(
+def get_document(
     document_id: int,
-    current_user: User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db),
 ):
     """Get a specific document"""
     document = (
         db.query(Document)
-        .filter(Document.id == document_id, Document.user_id == current_user.id)
+        .filter(Document.id == document_id, Document.user_id == user_id)
         .first()
     )
 
@@ -217,12 +279,6 @@ async def get_document(
             detail="Document not found",
         )
 
-    chunk_count = (
-        db.query(DocumentChunk)
-        .filter(DocumentChunk.document_id == document.id)
-        .count()
-    )
-
     return DocumentResponse(
         id=document.id,
         user_id=document.user_id,
@@ -231,20 +287,62 @@ async def get_document(
         file_size=document.file_size,
         upload_date=document.upload_date,
         processed=document.processed,
-        chunk_count=chunk_count,
+        chunk_count=document.chunk_count,
+    )
+
+
+@router.get("/{document_id}/status", response_model=DocumentStatusResponse)
+def get_document_status(
+    document_id: int,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    """Get the ingestion progress of a document"""
+    document = (
+        db.query(Document)
+        .filter(Document.id == document_id, Document.user_id == user_id)
+        .first()
+    )
+
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found",
+        )
+
+    chunks_processed = document.chunks_processed or 0
+    progress = None
+    if document.processed == 2:
+        progress = 1.0
+    elif document.chunks_total:
+        progress = round(chunks_processed / document.chunks_total, 4)
+    elif document.pages_total:
+        # PDFs: pages chunked so far, until the chunk total is known
+        progress = round((document.pages_processed or 0) / document.pages_total, 4)
+
+    return DocumentStatusResponse(
+        id=document.id,
+        processed=document.processed,
+        status=PROCESSING_STATUS_LABELS.get(document.processed, "unknown"),
+        chunks_processed=chunks_processed,
+        chunks_total=document.chunks_total,
+        pages_processed=document.pages_processed,
+        pages_total=document.pages_total,
+        progress=progress,
+        error=document.processing_error,
     )
 
 
 @router.delete("/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_document(
+def delete_document(
     document_id: int,
-    current_user: User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db),
 ):
     """Delete a document"""
     document = (
         db.query(Document)
-        .filter(Document.id == document_id, Document.user_id == current_user.id)
+        .filter(Document.id == document_id, Document.user_id == user_id)
         .first()
     )
 
@@ -265,4 +363,6 @@ async def delete_document(
     db.delete(document)
     db.commit()
 
+    answer_cache.invalidate_document(user_id, document_id)
+
     return None
@@ -1,35 +1,56 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from contextlib import aclosing
+import json
 
-from app.models.database import get_db
 from app.models.user import User
-from app.schemas.document import QueryRequest, QueryResponse
-from app.utils.auth import get_current_user
+from app.schemas.document import (
+    QueryRequest,
+    QueryResponse,
+    BatchQueryRequest,
+    BatchQueryResponse,
+)
+from app.utils.auth import get_cached_user
 from app.services.rag_service import rag_service
 
+# Routes take no request-scoped session: retrieval opens its own and
+# releases it before the LLM call
 router = APIRouter(prefix="/query", tags=["Query"])
 
 
+def format_sse(event: str, data: dict) -> str:
+    """Format a Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @router.post("/", response_model=QueryResponse)
 async def query_documents(
     query_request: QueryRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: User = Depends(get_cached_user),
 ):
     """Query documents using RAG"""
     try:
         result = await rag_service.query(
-            db=db,
             user=current_user,
             query=query_request.query,
             top_k=query_request.top_k,
             document_ids=query_request.document_ids,
+            ef_search=query_request.ef_search,
+            probes=query_request.probes,
+            use_cache=query_request.use_cache,
+            retrieval_mode=query_request.retrieval_mode,
+            vector_weight=query_request.vector_weight,
+            lexical_weight=query_request.lexical_weight,
+            rerank=query_request.rerank,
+            mmr_lambda=query_request.mmr_lambda,
         )
 
         return QueryResponse(
             answer=result["answer"],
             sources=result["sources"],
             query=result["query"],
+            cached=result["cached"],
+            context_tokens=result["context_tokens"],
         )
 
     except Exception as e:
@@ -37,3 +58,71 @@ async def query_documents(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing query: {str(e)}",
         )
+
+
+@router.post("/batch", response_model=BatchQueryResponse)
+async def query_documents_batch(
+    batch_request: BatchQueryRequest,
+    current_user: User = Depends(get_cached_user),
+):
+    """
+    Answer several queries in one request. Queries are embedded together,
+    retrieved in a single database round-trip and answered concurrently;
+    results are returned in order, with per-query errors in `error`.
+    """
+    try:
+        results = await rag_service.query_batch(
+            user=current_user,
+            queries=[item.model_dump() for item in batch_request.queries],
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing batch query: {str(e)}",
+        )
+
+    return BatchQueryResponse(results=results)
+
+
+@router.post("/stream")
+async def query_documents_stream(
+    query_request: QueryRequest,
+    request: Request,
+    current_user: User = Depends(get_cached_user),
+):
+    """
+    Query documents using RAG, streaming the answer as Server-Sent Events.
+    Emits a `sources` event first, then `token` events, then `done`
+    (or `error`). Upstream generation stops when the client disconnects.
+    """
+
+    async def event_stream():
+        try:
+            events = rag_service.query_stream(
+                user=current_user,
+                query=query_request.query,
+                top_k=query_request.top_k,
+                document_ids=query_request.document_ids,
+                ef_search=query_request.ef_search,
+                probes=query_request.probes,
+                use_cache=query_request.use_cache,
+                retrieval_mode=query_request.retrieval_mode,
+                vector_weight=query_request.vector_weight,
+                lexical_weight=query_request.lexical_weight,
+                rerank=query_request.rerank,
+                mmr_lambda=query_request.mmr_lambda,
+            )
+            # Leaving the block closes the upstream LLM response
+            async with aclosing(events):
+                async for event in events:
+                    if await request.is_disconnected():
+                        break
+                    yield format_sse(event["event"], event["data"])
+        except Exception as e:
+            yield format_sse("error", {"detail": f"Error processing query: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -5,12 +5,13 @@ from app.models.database import get_db
 from app.models.user import User
 from app.schemas.user import UserUpdate, UserResponse
 from app.utils.auth import get_current_user
+from app.utils.user_cache import user_cache
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
 
 @router.put("/me", response_model=UserResponse)
-async def update_user(
+def update_user(
     user_update: UserUpdate,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -55,6 +56,7 @@ async def update_user(
 
     db.commit()
     db.refresh(current_user)
+    user_cache.invalidate(current_user.id)
 
     return UserResponse(
         id=current_user.id,
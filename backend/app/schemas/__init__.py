@@ -9,9 +9,13 @@ from app.schemas.user import (
 from app.schemas.document import (
     DocumentCreate,
     DocumentResponse,
+    DocumentStatusResponse,
     DocumentChunkResponse,
     QueryRequest,
     QueryResponse,
+    BatchQueryRequest,
+    BatchQueryResult,
+    BatchQueryResponse,
     ChatMessage,
 )
 
@@ -24,8 +28,12 @@ __all__ = [
     "TokenData",
     "DocumentCreate",
     "DocumentResponse",
+    "DocumentStatusResponse",
     "DocumentChunkResponse",
     "QueryRequest",
     "QueryResponse",
+    "BatchQueryRequest",
+    "BatchQueryResult",
+    "BatchQueryResponse",
     "ChatMessage",
 ]
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Literal
 from datetime import datetime
 
 
@@ -24,6 +24,18 @@ class DocumentResponse(DocumentBase):
         from_attributes = True
 
 
+class DocumentStatusResponse(BaseModel):
+    id: int
+    processed: int
+    status: str
+    chunks_processed: int = 0
+    chunks_total: Optional[int] = None
+    pages_processed: Optional[int] = None  # PDFs only
+    pages_total: Optional[int] = None
+    progress: Optional[float] = None  # 0.0 - 1.0, None until a total is known
+    error: Optional[str] = None
+
+
 class DocumentChunkResponse(BaseModel):
     id: int
     document_id: int
@@ -39,12 +51,49 @@ class QueryRequest(BaseModel):
     query: str = Field(..., min_length=1, max_length=1000)
     top_k: int = Field(default=5, ge=1, le=20)
     document_ids: Optional[List[int]] = None
+    # Per-query ANN recall/latency trade-off (HNSW ef_search / IVFFlat probes)
+    ef_search: Optional[int] = Field(default=None, ge=1, le=1000)
+    probes: Optional[int] = Field(default=None, ge=1, le=1000)
+    # Set to False to bypass the answer cache and regenerate
+    use_cache: bool = True
+    # "vector" or "hybrid" (vector + full-text, fused with reciprocal rank
+    # fusion); None uses the server default (RETRIEVAL_MODE)
+    retrieval_mode: Optional[Literal["vector", "hybrid"]] = None
+    # Relative weight of each ranking in hybrid fusion
+    vector_weight: float = Field(default=1.0, ge=0, le=10)
+    lexical_weight: float = Field(default=1.0, ge=0, le=10)
+    # Rerank over-fetched candidates with the cross-encoder; None uses the
+    # server default (RERANK_ENABLED)
+    rerank: Optional[bool] = None
+    # Maximal marginal relevance: pick top_k from a larger candidate pool,
+    # trading relevance (1.0) against diversity (0.0); None disables MMR
+    mmr_lambda: Optional[float] = Field(default=None, ge=0, le=1)
 
 
 class QueryResponse(BaseModel):
     answer: str
     sources: List[dict]
     query: str
+    cached: bool = False
+    # Tokens of retrieved context sent to the LLM (after packing)
+    context_tokens: int = 0
+
+
+class BatchQueryRequest(BaseModel):
+    queries: List[QueryRequest] = Field(..., min_length=1, max_length=50)
+
+
+class BatchQueryResult(BaseModel):
+    query: str
+    answer: Optional[str] = None
+    sources: List[dict] = []
+    cached: bool = False
+    context_tokens: int = 0
+    error: Optional[str] = None  # set when this query failed
+
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchQueryResult]
 
 
 class ChatMessage(BaseModel):
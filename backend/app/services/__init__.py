@@ -1,11 +1,25 @@
 from app.services.document_processor import DocumentProcessor
+from app.services.embedding_cache import EmbeddingCache
+from app.services.embedding_backends import EmbeddingBackend, create_backend
+from app.services.answer_cache import AnswerCache, answer_cache
 from app.services.embedding_service import EmbeddingService, embedding_service
+from app.services.reranker_service import RerankerService, reranker_service
 from app.services.rag_service import RAGService, rag_service
+from app.services.ingestion_service import IngestionService, ingestion_service
 
 __all__ = [
     "DocumentProcessor",
+    "EmbeddingCache",
+    "EmbeddingBackend",
+    "create_backend",
+    "AnswerCache",
+    "answer_cache",
     "EmbeddingService",
     "embedding_service",
+    "RerankerService",
+    "reranker_service",
     "RAGService",
     "rag_service",
+    "IngestionService",
+    "ingestion_service",
 ]
@@ -0,0 +1,220 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+import hashlib
+import threading
+import time
+import unicodedata
+import os
+import numpy as np
+from dotenv import load_dotenv
+
+from app.utils.metrics import CACHE_LOOKUPS
+
+load_dotenv()
+
+
+class AnswerCache:
+    """
+    Bounded, thread-safe cache of generated RAG answers.
+
+    Entries are scoped by user, the set of retrieved chunk IDs, the LLM
+    (provider and model) and the prompt template, so an answer is only
+    reused when the LLM would have seen exactly the same context. Within a
+    scope, a query matches exactly (after normalization) or, when
+    ANSWER_CACHE_SEMANTIC_THRESHOLD is set, by cosine similarity of the
+    query embeddings.
+
+    Chunk IDs are never reused, so a deleted or re-processed document can
+    no longer produce a matching scope; invalidation just frees memory early.
+    """
+
+    def __init__(
+        self,
+        max_size: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        semantic_threshold: Optional[float] = None,
+    ):
+        if max_size is None:
+            max_size = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+        if semantic_threshold is None:
+            # 0 disables semantic matching (exact matches only)
+            semantic_threshold = float(os.getenv("ANSWER_CACHE_SEMANTIC_THRESHOLD", "0"))
+
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.semantic_threshold = semantic_threshold
+
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._scopes: Dict[str, set] = {}
+        self._documents: Dict[tuple, set] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(unicodedata.normalize("NFKC", text).lower().split())
+
+    @staticmethod
+    def make_scope(
+        user_id: int, chunk_ids: Iterable[int], llm_id: str, template_id: str
+    ) -> str:
+        """Hash of everything besides the query that determines the answer"""
+        ids = ",".join(str(chunk_id) for chunk_id in sorted(chunk_ids))
+        return hashlib.sha256(
+            f"{user_id}\0{ids}\0{llm_id}\0{template_id}".encode("utf-8")
+        ).hexdigest()
+
+    def get(
+        self,
+        scope: str,
+        query: str,
+        query_embedding: Optional[List[float]] = None,
+    ) -> Optional[Dict]:
+        """Look up a cached answer; returns the entry or None"""
+        if not self.enabled:
+            return None
+
+        now = time.monotonic()
+        key = f"{scope}:{self.normalize(query)}"
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires_at"] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                CACHE_LOOKUPS.inc(cache="answer", result="hit")
+                return entry
+            if entry is not None:
+                self._remove(key)
+
+            if self.semantic_threshold > 0 and query_embedding is not None:
+                match = self._semantic_match(scope, query_embedding, now)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.hits += 1
+                    self.semantic_hits += 1
+                    CACHE_LOOKUPS.inc(cache="answer", result="semantic_hit")
+                    return self._entries[match]
+
+            self.misses += 1
+            CACHE_LOOKUPS.inc(cache="answer", result="miss")
+            return None
+
+    def _semantic_match(
+        self, scope: str, query_embedding: List[float], now: float
+    ) -> Optional[str]:
+        """Find the most similar live entry in a scope above the threshold"""
+        keys = [
+            key
+            for key in self._scopes.get(scope, ())
+            if self._entries[key]["expires_at"] > now
+            and self._entries[key]["embedding"] is not None
+        ]
+        if not keys:
+            return None
+
+        candidates = np.stack([self._entries[key]["embedding"] for key in keys])
+        query_vec = np.asarray(query_embedding, dtype=np.float32)
+        norms = np.linalg.norm(candidates, axis=1) * np.linalg.norm(query_vec)
+        similarities = candidates @ query_vec / np.maximum(norms, 1e-12)
+
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.semantic_threshold:
+            return keys[best]
+        return None
+
+    def set(
+        self,
+        scope: str,
+        query: str,
+        query_embedding: Optional[List[float]],
+        user_id: int,
+        document_ids: Iterable[int],
+        answer: str,
+    ):
+        """Store an answer"""
+        if not self.enabled:
+            return
+
+        key = f"{scope}:{self.normalize(query)}"
+        document_keys = [(user_id, document_id) for document_id in set(document_ids)]
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = {
+                "expires_at": time.monotonic() + self.ttl_seconds,
+                "scope": scope,
+                "documents": document_keys,
+                "embedding": None
+                if query_embedding is None
+                else np.asarray(query_embedding, dtype=np.float32),
+                "answer": answer,
+            }
+            self._scopes.setdefault(scope, set()).add(key)
+            for document_key in document_keys:
+                self._documents.setdefault(document_key, set()).add(key)
+
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        """Remove an entry and its index references (caller holds the lock)"""
+        entry = self._entries.pop(key)
+
+        scope_keys = self._scopes.get(entry["scope"])
+        if scope_keys is not None:
+            scope_keys.discard(key)
+            if not scope_keys:
+                del self._scopes[entry["scope"]]
+
+        for document_key in entry["documents"]:
+            document_keys = self._documents.get(document_key)
+            if document_keys is not None:
+                document_keys.discard(key)
+                if not document_keys:
+                    del self._documents[document_key]
+
+    def invalidate_document(self, user_id: int, document_id: int) -> int:
+        """
+        Drop every answer generated from a document's chunks
+        Returns: Number of entries removed
+        """
+        with self._lock:
+            keys = list(self._documents.get((user_id, document_id), ()))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+            self._documents.clear()
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Global answer cache instance
+answer_cache = AnswerCache()
@@ -0,0 +1,236 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+import threading
+import time
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Longest chunk overlap looked for when merging adjacent chunks (the
+# splitter overlaps chunks by chunk_overlap=50 characters)
+MAX_OVERLAP_CHARS = 200
+MIN_OVERLAP_CHARS = 8
+
+
+def parse_budgets(value: str) -> Dict[str, int]:
+    """Parse "model=tokens,model=tokens" into a dict"""
+    budgets = {}
+    for item in value.split(","):
+        if "=" in item:
+            model, tokens = item.split("=", 1)
+            budgets[model.strip()] = int(tokens)
+    return budgets
+
+
+def merge_overlapping(first: str, second: str) -> str:
+    """Join two consecutive chunks, dropping the text they share"""
+    limit = min(len(first), len(second), MAX_OVERLAP_CHARS)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return f"{first} {second}"
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+class ContextPacker:
+    """
+    Packs retrieved chunks into the LLM context under a per-model token
+    budget.
+
+    Adjacent chunks (consecutive chunk_index on the same document page) are
+    merged with their shared overlap removed, chunks whose text is already
+    contained in a higher-ranked block are dropped, and blocks are then
+    added in relevance order until the model's budget is filled. Tokens are
+    counted with tiktoken (approximated when the encoding is unavailable).
+
+    tiktoken downloads its BPE files on first use, so encodings are loaded
+    at startup (start_warm_up) and packing runs off the event loop. A failed
+    load is retried after CONTEXT_ENCODING_RETRY_SECONDS.
+    """
+
+    def __init__(self):
+        self.default_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+        self.budgets = parse_budgets(os.getenv("CONTEXT_TOKEN_BUDGETS", ""))
+        # Blocks that don't fit whole are truncated only if this much
+        # budget is left
+        self.min_block_tokens = int(os.getenv("CONTEXT_MIN_BLOCK_TOKENS", "64"))
+        self.encoding_retry_seconds = float(os.getenv("CONTEXT_ENCODING_RETRY_SECONDS", "300"))
+        self._encodings: Dict[str, object] = {}
+        # Models whose encoding failed to load, and when
+        self._failed: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._warm_up_future: Optional[Future] = None
+
+    def budget_for(self, model: Optional[str]) -> int:
+        """Token budget for a model (exact name, else longest matching prefix)"""
+        if model:
+            if model in self.budgets:
+                return self.budgets[model]
+            prefixes = [name for name in self.budgets if model.startswith(name)]
+            if prefixes:
+                return self.budgets[max(prefixes, key=len)]
+        return self.default_budget
+
+    def _encoding(self, model: Optional[str]):
+        """
+        tiktoken encoding for a model (cl100k_base for unknown models), or
+        None while it is unavailable (blocking: may download the BPE file)
+        """
+        key = model or ""
+        encoding = self._encodings.get(key)
+        if encoding is not None:
+            return encoding
+
+        with self._lock:
+            if key in self._encodings:
+                return self._encodings[key]
+            failed_at = self._failed.get(key)
+            if failed_at is not None and time.monotonic() - failed_at < self.encoding_retry_seconds:
+                return None
+
+            try:
+                import tiktoken
+
+                try:
+                    encoding = tiktoken.encoding_for_model(model or "")
+                except KeyError:
+                    encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                print(
+                    f"Warning: tiktoken encoding for {model or 'default'} unavailable, "
+                    f"approximating token counts (retrying in {self.encoding_retry_seconds:.0f}s): {e}"
+                )
+                self._failed[key] = time.monotonic()
+                return None
+
+            self._failed.pop(key, None)
+            self._encodings[key] = encoding
+            return encoding
+
+    def warm_up(self, models: Iterable[Optional[str]]):
+        """Load the encodings of the given models"""
+        for model in set(models):
+            self._encoding(model)
+
+    def start_warm_up(self, models: Iterable[Optional[str]]) -> Future:
+        """Load encodings on a background thread without blocking"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="context-packer"
+                )
+        if self._warm_up_future is None:
+            self._warm_up_future = self._executor.submit(self.warm_up, list(models))
+        return self._warm_up_future
+
+    def count_tokens(self, text: str, model: Optional[str] = None) -> int:
+        encoding = self._encoding(model)
+        if encoding is None:
+            return (len(text) + 3) // 4
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int, model: Optional[str] = None) -> str:
+        """Cut text to at most max_tokens tokens"""
+        encoding = self._encoding(model)
+        if encoding is None:
+            return text[: max_tokens * 4]
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+    def merge_adjacent(self, chunks: List[Dict]) -> List[Dict]:
+        """
+        Merge runs of consecutive chunks from the same document page
+        Returns: Blocks in the rank order of their best chunk
+        """
+        rank = {id(chunk): position for position, chunk in enumerate(chunks)}
+        ordered = sorted(
+            chunks,
+            key=lambda chunk: (chunk["document_id"], chunk.get("chunk_index") or 0),
+        )
+
+        blocks = []
+        for chunk in ordered:
+            previous = blocks[-1] if blocks else None
+            if (
+                previous is not None
+                and chunk.get("chunk_index") is not None
+                and previous["document_id"] == chunk["document_id"]
+                and previous["page_number"] == chunk["page_number"]
+                and previous["last_chunk_index"] + 1 == chunk["chunk_index"]
+            ):
+                previous["text"] = merge_overlapping(previous["text"], chunk["text"])
+                previous["chunk_ids"].append(chunk["chunk_id"])
+                previous["last_chunk_index"] = chunk["chunk_index"]
+                previous["similarity"] = max(previous["similarity"], chunk["similarity"])
+                previous["rank"] = min(previous["rank"], rank[id(chunk)])
+                continue
+
+            blocks.append(
+                dict(
+                    chunk,
+                    chunk_ids=[chunk["chunk_id"]],
+                    last_chunk_index=chunk.get("chunk_index"),
+                    rank=rank[id(chunk)],
+                )
+            )
+
+        blocks.sort(key=lambda block: block["rank"])
+        for block in blocks:
+            del block["rank"], block["last_chunk_index"]
+        return blocks
+
+    def dedupe(self, blocks: List[Dict]) -> List[Dict]:
+        """Drop blocks whose text is contained in a higher-ranked block"""
+        kept = []
+        kept_texts = []
+        for block in blocks:
+            text = normalize(block["text"])
+            if any(text in other for other in kept_texts):
+                continue
+            kept.append(block)
+            kept_texts.append(text)
+        return kept
+
+    def pack(
+        self, chunks: List[Dict], model: Optional[str] = None, format_block=None
+    ) -> Tuple[List[Dict], int]:
+        """
+        Select and merge chunks to fit the model's context budget
+        `format_block(number, block)` renders a block as it appears in the
+        context, so headers count against the budget.
+        Returns: (blocks, tokens used)
+        """
+        if format_block is None:
+            format_block = lambda number, block: block["text"]
+
+        budget = self.budget_for(model)
+        packed = []
+        used = 0
+        for block in self.dedupe(self.merge_adjacent(chunks)):
+            remaining = budget - used
+            if remaining <= 0:
+                break
+
+            tokens = self.count_tokens(format_block(len(packed) + 1, block), model)
+            if tokens > remaining:
+                if remaining < self.min_block_tokens and packed:
+                    continue
+                header_tokens = tokens - self.count_tokens(block["text"], model)
+                block = dict(
+                    block,
+                    text=self.truncate(block["text"], max(remaining - header_tokens, 1), model),
+                )
+                tokens = self.count_tokens(format_block(len(packed) + 1, block), model)
+
+            packed.append(block)
+            used += tokens
+
+        return packed, used
+
+
+# Global context packer instance
+context_packer = ContextPacker()
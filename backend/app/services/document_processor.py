@@ -1,16 +1,97 @@
 import os
-from typing import List, Tuple
-import PyPDF2
-from docx import Document as DocxDocument
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import multiprocessing
+import threading
+import time
+from dotenv import load_dotenv
+
+# PyPDF2, python-docx and langchain are imported where they are used so that
+# importing this module (e.g. from the API routers) stays cheap
+
+load_dotenv()
+
+PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", "0"))  # 0: sequential
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "20"))
+PDF_SLOW_PAGE_SECONDS = float(os.getenv("PDF_SLOW_PAGE_SECONDS", "2.0"))
+# DOCX/TXT files have no pages; their text is streamed in blocks of this size
+TEXT_BLOCK_CHARS = int(os.getenv("TEXT_BLOCK_CHARS", "65536"))
+
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_lock = threading.Lock()
+
+
+def get_pdf_pool(max_workers: int) -> ProcessPoolExecutor:
+    """Shared process pool for PDF extraction (created on first use)"""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # spawn: forking a process that runs model inference threads is unsafe
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pdf_pool
+
+
+def shutdown_pdf_pool():
+    """Stop the PDF extraction pool"""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is not None:
+            _pdf_pool.shutdown(wait=False, cancel_futures=True)
+            _pdf_pool = None
+
+
+def iter_pdf_page_range(
+    file_path: str, start: int, end: Optional[int] = None
+) -> Iterator[Tuple[str, int, float]]:
+    """
+    Extract pages [start, end) of a PDF one page at a time
+    Yields: Tuples (text, page_number, seconds)
+    """
+    import PyPDF2
+
+    with open(file_path, "rb") as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        page_count = len(pdf_reader.pages)
+        for index in range(start, page_count if end is None else min(end, page_count)):
+            started = time.perf_counter()
+            text = pdf_reader.pages[index].extract_text()
+            yield (text, index + 1, time.perf_counter() - started)
+
+
+def extract_pdf_page_range(
+    file_path: str, start: int, end: int
+) -> List[Tuple[str, int, float]]:
+    """
+    Extract pages [start, end) of a PDF (runs in a worker process)
+    Returns: List of tuples (text, page_number, seconds)
+    """
+    return list(iter_pdf_page_range(file_path, start, end))
 
 
 class DocumentProcessor:
     """Service for processing and chunking documents"""
 
-    def __init__(self, chunk_size: int = 512, chunk_overlap: int = 50):
+    def __init__(
+        self,
+        chunk_size: int = 512,
+        chunk_overlap: int = 50,
+        pdf_workers: Optional[int] = None,
+    ):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.pdf_workers = PDF_EXTRACTION_WORKERS if pdf_workers is None else pdf_workers
+        self.pdf_pages_per_task = PDF_PAGES_PER_TASK
+        # Per-page timings of the most recent PDF extraction
+        self.page_timings: List[Tuple[int, float]] = []
+        # Page count of the PDF being extracted, set once extraction starts
+        self.page_count: Optional[int] = None
+
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
@@ -23,50 +104,146 @@ class DocumentProcessor:
         Extract text from PDF file
         Returns: List of tuples (text, page_number)
         """
-        pages_text = []
+        return list(self.iter_pdf_pages(file_path))
+
+    def iter_pdf_pages(self, file_path: str) -> Iterator[Tuple[str, int]]:
+        """
+        Yield (text, page_number) for each non-empty PDF page, in page order.
+        With pdf_workers > 0, page ranges are extracted in parallel by a
+        process pool and yielded as soon as each range (in order) is ready.
+        """
+        self.page_timings = []
+        self.page_count = None
         try:
+            import PyPDF2
+
             with open(file_path, "rb") as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page_num, page in enumerate(pdf_reader.pages, start=1):
-                    text = page.extract_text()
-                    if text.strip():
-                        pages_text.append((text, page_num))
+                page_count = len(PyPDF2.PdfReader(file).pages)
+            self.page_count = page_count
+
+            if self.pdf_workers > 0 and page_count > self.pdf_pages_per_task:
+                pages = (
+                    page
+                    for page_results in self._extract_pdf_parallel(file_path, page_count)
+                    for page in page_results
+                )
+            else:
+                pages = iter_pdf_page_range(file_path, 0)
+
+            for text, page_num, seconds in pages:
+                self._record_page_timing(file_path, page_num, seconds)
+                if text.strip():
+                    yield (text, page_num)
         except Exception as e:
             raise Exception(f"Error extracting text from PDF: {str(e)}")
 
-        return pages_text
+    def _extract_pdf_parallel(
+        self, file_path: str, page_count: int
+    ) -> Iterator[List[Tuple[str, int, float]]]:
+        """Extract page ranges on the process pool, yielding results in page order"""
+        pool = get_pdf_pool(self.pdf_workers)
+        starts = iter(range(0, page_count, self.pdf_pages_per_task))
+        # Bound the number of in-flight ranges so results don't pile up in memory
+        pending = deque()
+        try:
+            for start in starts:
+                pending.append(
+                    pool.submit(
+                        extract_pdf_page_range, file_path, start, start + self.pdf_pages_per_task
+                    )
+                )
+                if len(pending) >= self.pdf_workers * 2:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _record_page_timing(self, file_path: str, page_num: int, seconds: float):
+        self.page_timings.append((page_num, seconds))
+        if seconds >= PDF_SLOW_PAGE_SECONDS:
+            print(f"Slow PDF page: {os.path.basename(file_path)} page {page_num} took {seconds:.2f}s")
+
+    def page_timing_stats(self) -> Dict:
+        """Summary of per-page timings from the most recent PDF extraction"""
+        if not self.page_timings:
+            return {"pages": 0}
+
+        seconds = [elapsed for _, elapsed in self.page_timings]
+        slowest = sorted(self.page_timings, key=lambda item: item[1], reverse=True)[:5]
+        return {
+            "pages": len(seconds),
+            "total_seconds": round(sum(seconds), 3),
+            "mean_seconds": round(sum(seconds) / len(seconds), 4),
+            "max_seconds": round(max(seconds), 3),
+            "slowest_pages": [
+                {"page_number": page_num, "seconds": round(elapsed, 3)}
+                for page_num, elapsed in slowest
+            ],
+        }
 
     def extract_text_from_docx(self, file_path: str) -> List[Tuple[str, int]]:
         """
         Extract text from DOCX file
         Returns: List of tuples (text, page_number)
-        Note: DOCX doesn't have explicit pages, so we use paragraph count as proxy
+        Note: DOCX doesn't have explicit pages, so all text is reported as page 1
+        """
+        return list(self.iter_docx_blocks(file_path))
+
+    def iter_docx_blocks(self, file_path: str) -> Iterator[Tuple[str, int]]:
+        """
+        Yield the text of a DOCX file as (text, 1) blocks of roughly
+        TEXT_BLOCK_CHARS characters, split on paragraph boundaries
         """
-        pages_text = []
         try:
+            from docx import Document as DocxDocument
+
             doc = DocxDocument(file_path)
-            full_text = []
+            block = []
+            block_chars = 0
             for para in doc.paragraphs:
-                if para.text.strip():
-                    full_text.append(para.text)
+                if not para.text.strip():
+                    continue
+                block.append(para.text)
+                block_chars += len(para.text) + 1
+                if block_chars >= TEXT_BLOCK_CHARS:
+                    yield ("\n".join(block), 1)
+                    block = []
+                    block_chars = 0
 
-            # Combine all text
-            text = "\n".join(full_text)
-            pages_text.append((text, 1))
+            if block:
+                yield ("\n".join(block), 1)
         except Exception as e:
             raise Exception(f"Error extracting text from DOCX: {str(e)}")
 
-        return pages_text
-
     def extract_text_from_txt(self, file_path: str) -> List[Tuple[str, int]]:
         """
         Extract text from TXT file
         Returns: List of tuples (text, page_number)
         """
+        return list(self.iter_txt_blocks(file_path))
+
+    def iter_txt_blocks(self, file_path: str) -> Iterator[Tuple[str, int]]:
+        """
+        Yield the text of a TXT file as (text, 1) blocks of roughly
+        TEXT_BLOCK_CHARS characters, split on line boundaries
+        """
         try:
             with open(file_path, "r", encoding="utf-8") as file:
-                text = file.read()
-            return [(text, 1)]
+                block = []
+                block_chars = 0
+                for line in file:
+                    block.append(line)
+                    block_chars += len(line)
+                    if block_chars >= TEXT_BLOCK_CHARS:
+                        yield ("".join(block), 1)
+                        block = []
+                        block_chars = 0
+
+                if block:
+                    yield ("".join(block), 1)
         except Exception as e:
             raise Exception(f"Error reading text file: {str(e)}")
 
@@ -75,12 +252,19 @@ class DocumentProcessor:
         Extract text from document based on file type
         Returns: List of tuples (text, page_number)
         """
+        return list(self.iter_pages(file_path, file_type))
+
+    def iter_pages(self, file_path: str, file_type: str) -> Iterator[Tuple[str, int]]:
+        """
+        Lazily extract text from document based on file type
+        Yields: Tuples (text, page_number)
+        """
         if file_type == "pdf":
-            return self.extract_text_from_pdf(file_path)
+            return self.iter_pdf_pages(file_path)
         elif file_type == "docx":
-            return self.extract_text_from_docx(file_path)
+            return self.iter_docx_blocks(file_path)
         elif file_type == "txt":
-            return self.extract_text_from_txt(file_path)
+            return self.iter_txt_blocks(file_path)
         else:
             raise ValueError(f"Unsupported file type: {file_type}")
 
@@ -94,7 +278,15 @@ class DocumentProcessor:
         Returns:
             List of tuples (chunk_text, page_number, chunk_index)
         """
-        chunks = []
+        return list(self.iter_split(pages_text))
+
+    def iter_split(
+        self, pages_text: Iterable[Tuple[str, int]]
+    ) -> Iterator[Tuple[str, int, int]]:
+        """
+        Lazily split pages into chunks
+        Yields: Tuples (chunk_text, page_number, chunk_index)
+        """
         chunk_index = 0
 
         for text, page_num in pages_text:
@@ -103,10 +295,17 @@ class DocumentProcessor:
 
             for chunk_text in text_chunks:
                 if chunk_text.strip():
-                    chunks.append((chunk_text, page_num, chunk_index))
+                    yield (chunk_text, page_num, chunk_index)
                     chunk_index += 1
 
-        return chunks
+    def iter_chunks(self, file_path: str, file_type: str) -> Iterator[Tuple[str, int, int]]:
+        """
+        Stream a document through extraction and chunking. Only the current
+        page (or text block) is held in memory, so consumers can embed and
+        store chunks in bounded batches while the rest is still being parsed.
+        Yields: Tuples (chunk_text, page_number, chunk_index)
+        """
+        return self.iter_split(self.iter_pages(file_path, file_type))
 
     def process_document(
         self, file_path: str, file_type: str
@@ -115,10 +314,4 @@ class DocumentProcessor:
         Process document: extract text and chunk it
         Returns: List of tuples (chunk_text, page_number, chunk_index)
         """
-        # Extract text from document
-        pages_text = self.extract_text(file_path, file_type)
-
-        # Chunk the text
-        chunks = self.chunk_text(pages_text)
-
-        return chunks
+        return list(self.iter_chunks(file_path, file_type))
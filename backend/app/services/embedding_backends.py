@@ -0,0 +1,305 @@
+"""
+Inference backends for EmbeddingService
+
+Backends (EMBEDDING_BACKEND):
+    torch       full-precision PyTorch SentenceTransformer (reference)
+    torch-int8  PyTorch with Linear layers dynamically quantized to int8
+    onnx        ONNX Runtime (requires onnxruntime)
+    onnx-int8   ONNX Runtime with int8 dynamically quantized weights
+
+Thread counts and batch sizes can be set per backend, e.g.
+EMBEDDING_ONNX_INT8_NUM_THREADS, falling back to EMBEDDING_NUM_THREADS.
+"""
+from typing import Dict, List, Optional
+import json
+import time
+import os
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BACKENDS = ["torch", "torch-int8", "onnx", "onnx-int8"]
+
+ONNX_CACHE_DIR = os.getenv("EMBEDDING_ONNX_DIR", "./models/onnx")
+
+
+def backend_setting(backend: str, name: str, default: str) -> str:
+    """Read EMBEDDING_<BACKEND>_<NAME>, falling back to EMBEDDING_<NAME>"""
+    prefix = backend.upper().replace("-", "_")
+    return os.getenv(
+        f"EMBEDDING_{prefix}_{name}", os.getenv(f"EMBEDDING_{name}", default)
+    )
+
+
+class EmbeddingBackend:
+    """Base class: turns a batch of texts into a (n, dim) float32 array"""
+
+    name = "base"
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.batch_size = int(backend_setting(self.name, "BATCH_SIZE", "64"))
+        self.num_threads = int(backend_setting(self.name, "NUM_THREADS", "0"))  # 0: library default
+
+    def encode(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        raise NotImplementedError
+
+    def get_dimension(self) -> int:
+        raise NotImplementedError
+
+
+class TorchBackend(EmbeddingBackend):
+    """Full-precision SentenceTransformer"""
+
+    name = "torch"
+    device = None  # sentence-transformers picks CUDA when available
+
+    def __init__(self, model_name: str):
+        super().__init__(model_name)
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)  # process-wide setting
+        self.model = SentenceTransformer(model_name, device=self.device)
+
+    def encode(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=batch_size or self.batch_size,
+            convert_to_numpy=True,
+        ).astype(np.float32, copy=False)
+
+    def get_dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+
+class QuantizedTorchBackend(TorchBackend):
+    """SentenceTransformer with Linear layers dynamically quantized to int8 (CPU)"""
+
+    name = "torch-int8"
+    device = "cpu"  # dynamic quantization is CPU-only
+
+    def __init__(self, model_name: str):
+        super().__init__(model_name)
+        import torch
+
+        self.model = torch.quantization.quantize_dynamic(
+            self.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    ONNX Runtime inference of the transformer, with the SentenceTransformer
+    pooling/normalization reproduced in NumPy. The model is exported (and
+    optionally quantized) into EMBEDDING_ONNX_DIR on first use.
+    """
+
+    name = "onnx"
+    quantize = False
+
+    def __init__(self, model_name: str):
+        super().__init__(model_name)
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError(
+                f"EMBEDDING_BACKEND={self.name} requires onnxruntime to be installed"
+            )
+        from transformers import AutoTokenizer
+
+        model_dir = os.path.join(ONNX_CACHE_DIR, model_name.replace("/", "__"))
+        model_path = os.path.join(
+            model_dir, "model-int8.onnx" if self.quantize else "model.onnx"
+        )
+        if not os.path.exists(model_path):
+            export_onnx_model(model_name, model_dir, quantize=self.quantize)
+
+        with open(os.path.join(model_dir, "pooling.json")) as f:
+            self.pooling = json.load(f)
+
+        options = ort.SessionOptions()
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        self.session = ort.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+    def encode(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        batch_size = batch_size or self.batch_size
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            outputs.append(self._encode_batch(texts[start : start + batch_size]))
+        return np.concatenate(outputs) if outputs else np.zeros((0, self.get_dimension()), np.float32)
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.pooling["max_seq_length"],
+            return_tensors="np",
+        )
+        inputs = {
+            name: encoded[name].astype(np.int64)
+            for name in ("input_ids", "attention_mask", "token_type_ids")
+            if name in self.input_names and name in encoded
+        }
+        token_embeddings = self.session.run(None, inputs)[0]
+
+        if self.pooling["mode"] == "cls":
+            embeddings = token_embeddings[:, 0]
+        else:
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(
+                mask.sum(axis=1), 1e-9, None
+            )
+
+        if self.pooling["normalize"]:
+            embeddings = embeddings / np.clip(
+                np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None
+            )
+        return embeddings.astype(np.float32, copy=False)
+
+    def get_dimension(self) -> int:
+        return self.pooling["dimension"]
+
+
+class QuantizedOnnxBackend(OnnxBackend):
+    """ONNX Runtime with int8 dynamically quantized weights"""
+
+    name = "onnx-int8"
+    quantize = True
+
+
+def export_onnx_model(model_name: str, model_dir: str, quantize: bool = False):
+    """Export a SentenceTransformer's transformer to ONNX (plus tokenizer and pooling config)"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(model_dir, exist_ok=True)
+    model_path = os.path.join(model_dir, "model.onnx")
+
+    if not os.path.exists(model_path):
+        print(f"Exporting {model_name} to ONNX in {model_dir}")
+        reference = SentenceTransformer(model_name, device="cpu")
+        transformer = reference[0].auto_model
+        tokenizer = reference.tokenizer
+
+        dummy = tokenizer(["export"], return_tensors="pt")
+        input_names = [
+            name
+            for name in ("input_ids", "attention_mask", "token_type_ids")
+            if name in dummy
+        ]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+        torch.onnx.export(
+            transformer,
+            tuple(dummy[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+        tokenizer.save_pretrained(model_dir)
+
+        pooling_module = next(
+            (module for module in reference if type(module).__name__ == "Pooling"), None
+        )
+        pooling_config = pooling_module.get_config_dict() if pooling_module else {}
+        with open(os.path.join(model_dir, "pooling.json"), "w") as f:
+            json.dump(
+                {
+                    "mode": "cls" if pooling_config.get("pooling_mode_cls_token") else "mean",
+                    "normalize": any(
+                        type(module).__name__ == "Normalize" for module in reference
+                    ),
+                    "max_seq_length": reference.max_seq_length,
+                    "dimension": reference.get_sentence_embedding_dimension(),
+                },
+                f,
+            )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(
+            model_path,
+            os.path.join(model_dir, "model-int8.onnx"),
+            weight_type=QuantType.QInt8,
+        )
+
+
+def create_backend(name: str, model_name: str) -> EmbeddingBackend:
+    """Instantiate an embedding backend by name"""
+    backends = {
+        "torch": TorchBackend,
+        "torch-int8": QuantizedTorchBackend,
+        "onnx": OnnxBackend,
+        "onnx-int8": QuantizedOnnxBackend,
+    }
+    if name not in backends:
+        raise ValueError(f"Unsupported embedding backend: {name} (choose from {', '.join(BACKENDS)})")
+    return backends[name](model_name)
+
+
+def parity_check(
+    backend: EmbeddingBackend, reference: EmbeddingBackend, texts: List[str]
+) -> Dict:
+    """
+    Compare a backend's embeddings with the reference backend
+    Returns: Cosine similarity / drift statistics over the texts
+    """
+    candidate = backend.encode(texts)
+    expected = reference.encode(texts)
+
+    norms = np.linalg.norm(candidate, axis=1) * np.linalg.norm(expected, axis=1)
+    cosine = (candidate * expected).sum(axis=1) / np.clip(norms, 1e-12, None)
+    drift = 1.0 - cosine
+    return {
+        "backend": backend.name,
+        "reference": reference.name,
+        "texts": len(texts),
+        "mean_cosine": round(float(cosine.mean()), 6),
+        "min_cosine": round(float(cosine.min()), 6),
+        "mean_drift": round(float(drift.mean()), 6),
+        "max_drift": round(float(drift.max()), 6),
+    }
+
+
+def benchmark(
+    backend: EmbeddingBackend, texts: List[str], batch_size: Optional[int] = None, repeats: int = 3
+) -> Dict:
+    """
+    Measure backend throughput (best of `repeats` runs after one warm-up)
+    Returns: Texts/sec and single-text latency
+    """
+    backend.encode(texts[:batch_size or backend.batch_size], batch_size)
+
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        backend.encode(texts, batch_size)
+        best = min(best, time.perf_counter() - started)
+
+    single = []
+    for text in texts[:20]:
+        started = time.perf_counter()
+        backend.encode([text], 1)
+        single.append(time.perf_counter() - started)
+
+    return {
+        "backend": backend.name,
+        "texts": len(texts),
+        "batch_size": batch_size or backend.batch_size,
+        "num_threads": backend.num_threads or "default",
+        "texts_per_second": round(len(texts) / best, 1),
+        "single_text_ms_p50": round(float(np.median(single)) * 1000, 2),
+    }
@@ -0,0 +1,145 @@
+from concurrent.futures import Executor
+from typing import Callable, List, Optional
+import asyncio
+import os
+from dotenv import load_dotenv
+
+from app.utils import metrics
+
+load_dotenv()
+
+BATCH_SIZE_HISTOGRAM = metrics.histogram(
+    "embedding_batch_size",
+    "Texts per batched embedding forward pass",
+    labelnames=("batcher",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+QUEUE_WAIT_HISTOGRAM = metrics.histogram(
+    "embedding_queue_wait_seconds",
+    "Time a request waited in the batching queue before its forward pass started",
+    labelnames=("batcher",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+ENCODE_HISTOGRAM = metrics.histogram(
+    "embedding_batch_encode_seconds",
+    "Duration of batched embedding forward passes",
+    labelnames=("batcher",),
+)
+
+
+class EmbeddingBatcher:
+    """
+    Dynamic micro-batching for embedding requests.
+
+    Callers await embed(texts); the batcher collects pending requests until
+    max_batch_size texts are queued or window_ms has passed since the first
+    one arrived, runs a single batched encode on the executor and resolves
+    each caller's future with its slice of the result.
+
+    Batch sizes, queue waits and encode durations are recorded in the
+    embedding_* histograms (labelled with `name`) exposed on /metrics.
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[List[str]], List[List[float]]],
+        executor: Optional[Executor] = None,
+        window_ms: Optional[float] = None,
+        max_batch_size: Optional[int] = None,
+        name: str = "server",
+    ):
+        if window_ms is None:
+            window_ms = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+        if max_batch_size is None:
+            max_batch_size = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "64"))
+
+        self.encode = encode
+        self.executor = executor
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.name = name
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self):
+        """Start the batching loop on the running event loop"""
+        loop = asyncio.get_running_loop()
+        # A loop left over from a previous event loop (e.g. between test
+        # runs) can never be woken again, so start a fresh one
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._queue = asyncio.Queue()
+            self._loop = loop
+            self._worker = loop.create_task(self._run())
+
+    async def stop(self):
+        """Stop the batching loop"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts as part of the next micro-batch"""
+        if not texts:
+            return []
+
+        self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        await self._queue.put((texts, future, loop.time()))
+        return await future
+
+    async def _collect(self) -> list:
+        """Wait for the first request, then gather more until the window closes or the batch is full"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        size = len(batch[0][0])
+        deadline = loop.time() + self.window
+
+        while size < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            size += len(item[0])
+
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Skip requests whose callers have gone away
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            texts = [text for item_texts, _, _ in batch for text in item_texts]
+            started = loop.time()
+            for _, _, enqueued_at in batch:
+                QUEUE_WAIT_HISTOGRAM.observe(started - enqueued_at, batcher=self.name)
+            BATCH_SIZE_HISTOGRAM.observe(len(texts), batcher=self.name)
+
+            try:
+                embeddings = await loop.run_in_executor(self.executor, self.encode, texts)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                ENCODE_HISTOGRAM.observe(loop.time() - started, batcher=self.name)
+
+            offset = 0
+            for item_texts, future, _ in batch:
+                if not future.done():
+                    future.set_result(embeddings[offset : offset + len(item_texts)])
+                offset += len(item_texts)
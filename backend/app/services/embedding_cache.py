@@ -0,0 +1,171 @@
+from collections import OrderedDict
+from typing import List, Optional
+import hashlib
+import threading
+import time
+import unicodedata
+import os
+import numpy as np
+from dotenv import load_dotenv
+
+from app.utils.metrics import CACHE_LOOKUPS
+
+load_dotenv()
+
+
+class EmbeddingCache:
+    """
+    Bounded, thread-safe LRU cache of embeddings with TTL expiry.
+
+    Entries are keyed on the model name plus whitespace/unicode-normalized
+    text. When EMBEDDING_CACHE_REDIS_URL is set (and the optional `redis`
+    package is installed), Redis is used as a second tier shared by all
+    uvicorn workers.
+    """
+
+    def __init__(
+        self,
+        max_size: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        redis_url: Optional[str] = None,
+    ):
+        if max_size is None:
+            max_size = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "3600"))
+        if redis_url is None:
+            redis_url = os.getenv("EMBEDDING_CACHE_REDIS_URL")
+
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+        self._redis = None
+        if redis_url:
+            try:
+                import redis
+
+                self._redis = redis.Redis.from_url(redis_url)
+            except ImportError:
+                print("Warning: redis is not installed, embedding cache is process-local")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normalize text so trivially different queries share an entry"""
+        return " ".join(unicodedata.normalize("NFKC", text).split())
+
+    def make_key(self, model_name: str, text: str) -> str:
+        """Build the cache key for a model/text pair"""
+        digest = hashlib.sha256(
+            f"{model_name}\0{self.normalize(text)}".encode("utf-8")
+        ).hexdigest()
+        return f"emb:{digest}"
+
+    def get(
+        self, model_name: str, text: str, shared: bool = True
+    ) -> Optional[List[float]]:
+        """
+        Look up an embedding; returns None on a miss
+        With shared=False only the process-local tier is checked (no network
+        I/O, safe on the event loop) and misses are not counted.
+        """
+        if not self.enabled:
+            return None
+
+        key = self.make_key(model_name, text)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, embedding = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    CACHE_LOOKUPS.inc(cache="embedding", result="hit")
+                    return embedding
+                del self._entries[key]
+
+        if not shared:
+            return None
+
+        embedding = self._get_shared(key)
+        if embedding is not None:
+            self._set_local(key, embedding)
+            with self._lock:
+                self.hits += 1
+                self.shared_hits += 1
+            CACHE_LOOKUPS.inc(cache="embedding", result="shared_hit")
+            return embedding
+
+        with self._lock:
+            self.misses += 1
+        CACHE_LOOKUPS.inc(cache="embedding", result="miss")
+        return None
+
+    def set(self, model_name: str, text: str, embedding: List[float]):
+        """Store an embedding"""
+        if not self.enabled:
+            return
+
+        key = self.make_key(model_name, text)
+        self._set_local(key, embedding)
+        self._set_shared(key, embedding)
+
+    def _set_local(self, key: str, embedding: List[float]):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _get_shared(self, key: str) -> Optional[List[float]]:
+        if self._redis is None:
+            return None
+        try:
+            value = self._redis.get(key)
+        except Exception as e:
+            print(f"Warning: embedding cache backend error: {e}")
+            return None
+        if value is None:
+            return None
+        return np.frombuffer(value, dtype=np.float32).tolist()
+
+    def _set_shared(self, key: str, embedding: List[float]):
+        if self._redis is None:
+            return
+        try:
+            self._redis.set(
+                key,
+                np.asarray(embedding, dtype=np.float32).tobytes(),
+                ex=max(1, int(self.ttl_seconds)),
+            )
+        except Exception as e:
+            print(f"Warning: embedding cache backend error: {e}")
+
+    def clear(self):
+        """Drop all process-local entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -1,59 +1,273 @@
-from sentence_transformers import SentenceTransformer
-from typing import List
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+import asyncio
+import threading
 import os
+import httpx
+import numpy as np
 from dotenv import load_dotenv
 
+from app.services.embedding_cache import EmbeddingCache
+from app.services.embedding_backends import EmbeddingBackend, create_backend
+from app.services.embedding_batcher import EmbeddingBatcher
+
 load_dotenv()
 
 
 class EmbeddingService:
-    """Service for generating embeddings using sentence-transformers"""
+    """
+    Service for generating embeddings using sentence-transformers.
+
+    Inference runs on a pluggable backend (EMBEDDING_BACKEND: torch,
+    torch-int8, onnx, onnx-int8; see embedding_backends). The model is
+    loaded lazily on first use or by warm_up(), so importing this module is
+    cheap and routes that never embed are not delayed by model loading.
+
+    When EMBEDDING_SERVER_URL is set (http://host:port or unix:///path.sock)
+    the service is a thin client of app.embedding_server, which owns the
+    single copy of the model shared by all uvicorn workers.
 
-    def __init__(self, model_name: str = None):
+    Concurrent async query embeddings (aembed_text) are micro-batched into
+    single forward passes unless EMBEDDING_QUERY_BATCHING=false.
+    """
+
+    def __init__(
+        self, model_name: str = None, backend: str = None, server_url: str = None
+    ):
         if model_name is None:
             model_name = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+        if backend is None:
+            backend = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+        if server_url is None:
+            server_url = os.getenv("EMBEDDING_SERVER_URL", "")
 
         self.model_name = model_name
-        self.model = None
-        self._load_model()
+        self.backend_name = backend
+        # Identifies the vectors this service produces; backends drift slightly
+        # from each other, so cached embeddings are keyed on both
+        self.model_id = f"{model_name}:{backend}"
+        self.model: Optional[EmbeddingBackend] = None
+        # Query embeddings are cached; ingestion (embed_texts) bypasses the cache
+        self.cache = EmbeddingCache()
+        # Dedicated pool for model inference so CPU-bound encode() calls never
+        # run on the event loop or compete with the default request threadpool
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("EMBEDDING_EXECUTOR_WORKERS", "2")),
+            thread_name_prefix="embedding",
+        )
+        self._model_lock = threading.Lock()
+        self._warm_up_future: Optional[Future] = None
 
-    def _load_model(self):
-        """Load the embedding model"""
+        self.query_batching = os.getenv("EMBEDDING_QUERY_BATCHING", "true").lower() == "true"
+        self.query_batcher = EmbeddingBatcher(
+            self.embed_queries,
+            executor=self._executor,
+            window_ms=float(os.getenv("EMBEDDING_QUERY_BATCH_WINDOW_MS", "2")),
+            max_batch_size=int(os.getenv("EMBEDDING_QUERY_MAX_BATCH_SIZE", "32")),
+            name="query",
+        )
+
+        self.server_url = server_url
+        self._server_client: Optional[httpx.Client] = None
+        self._server_client_lock = threading.Lock()
+        self._server_dimension: Optional[int] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """The dedicated inference executor"""
+        return self._executor
+
+    @property
+    def is_remote(self) -> bool:
+        """Whether inference is delegated to the shared embedding server"""
+        return bool(self.server_url)
+
+    @property
+    def is_ready(self) -> bool:
+        """Whether the model is loaded and inference can run immediately"""
+        if self.is_remote:
+            try:
+                return self._server_health().get("status") == "ready"
+            except Exception:
+                return False
+        return self.model is not None
+
+    def _get_server_client(self) -> httpx.Client:
+        """Pooled client for the embedding server (HTTP or Unix socket)"""
+        if self._server_client is None:
+            # Created once, even when several executor threads need it first
+            with self._server_client_lock:
+                if self._server_client is None:
+                    timeout = float(os.getenv("EMBEDDING_SERVER_TIMEOUT", "30"))
+                    if self.server_url.startswith("unix://"):
+                        self._server_client = httpx.Client(
+                            transport=httpx.HTTPTransport(uds=self.server_url[len("unix://"):]),
+                            base_url="http://embedding-server",
+                            timeout=timeout,
+                        )
+                    else:
+                        self._server_client = httpx.Client(
+                            base_url=self.server_url, timeout=timeout
+                        )
+        return self._server_client
+
+    def _server_health(self) -> dict:
+        response = self._get_server_client().get("/health")
+        response.raise_for_status()
+        return response.json()
+
+    def _check_server_model(self, server_model_id: Optional[str]):
+        """
+        Refuse vectors from a server running another model or backend: cached
+        query embeddings and chunk hashes are keyed on this process's model_id
+        """
+        if server_model_id and server_model_id != self.model_id:
+            raise Exception(
+                f"Embedding server at {self.server_url} serves {server_model_id}, "
+                f"but EMBEDDING_MODEL/EMBEDDING_BACKEND here give {self.model_id}"
+            )
+
+    def verify_server_model(self):
+        """
+        Check that the embedding server runs the configured model (blocking;
+        raises on a mismatch). An unreachable server is checked on its first
+        /embed response instead.
+        """
+        if not self.is_remote:
+            return
         try:
-            self.model = SentenceTransformer(self.model_name)
-            print(f"Loaded embedding model: {self.model_name}")
-        except Exception as e:
-            print(f"Error loading model: {e}")
-            raise
+            # /health reports model_id while the model is still loading (503)
+            response = self._get_server_client().get("/health")
+            server_model_id = response.json().get("model_id")
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Warning: Could not check the embedding server's model: {e}")
+            return
+        self._check_server_model(server_model_id)
+
+    def _remote_encode(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts on the embedding server (float32 rows in the response body)"""
+        response = self._get_server_client().post("/embed", json={"texts": texts})
+        response.raise_for_status()
+        self._check_server_model(response.headers.get("X-Embedding-Model"))
+        dimension = int(response.headers["X-Embedding-Dimension"])
+        self._server_dimension = dimension
+        return np.frombuffer(response.content, dtype=np.float32).reshape(-1, dimension).tolist()
+
+    def _load_model(self):
+        """Load the embedding model (once, even under concurrent first use)"""
+        with self._model_lock:
+            if self.model is not None:
+                return
+            try:
+                # Deferred: backends import torch / onnxruntime
+                self.model = create_backend(self.backend_name, self.model_name)
+                print(f"Loaded embedding model: {self.model_name} ({self.backend_name} backend)")
+            except Exception as e:
+                print(f"Error loading model: {e}")
+                raise
+
+    def warm_up(self):
+        """Load the model and run one inference so the first request is fast"""
+        if self.is_remote:
+            return
+        self._load_model()
+        self.model.encode(["warm up"], 1)
+
+    def start_warm_up(self) -> Future:
+        """Warm the model up on the inference executor without blocking"""
+        if self._warm_up_future is None:
+            self._warm_up_future = self._executor.submit(self.warm_up)
+        return self._warm_up_future
 
     def embed_text(self, text: str) -> List[float]:
         """
-        Generate embedding for a single text
+        Generate embedding for a single text (served from the cache when possible)
         Returns: List of floats (embedding vector)
         """
-        if self.model is None:
-            self._load_model()
+        return self.embed_queries([text])[0]
 
-        embedding = self.model.encode(text, convert_to_numpy=True)
-        return embedding.tolist()
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed query texts, serving cached ones and encoding the rest in one batch
+        Returns: List of embeddings (same order as texts)
+        """
+        embeddings = [self.cache.get(self.model_id, text) for text in texts]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            encoded = self.encode([texts[i] for i in missing], len(missing))
+            for i, embedding in zip(missing, encoded):
+                embeddings[i] = embedding
+                self.cache.set(self.model_id, texts[i], embedding)
+        return embeddings
 
-    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+    def embed_texts(
+        self, texts: List[str], batch_size: Optional[int] = None
+    ) -> List[List[float]]:
         """
-        Generate embeddings for multiple texts
+        Generate embeddings for multiple texts in batched forward passes
         Returns: List of embeddings
         """
+        if not texts:
+            return []
+
+        return self.encode(texts, batch_size)
+
+    def encode(
+        self, texts: List[str], batch_size: Optional[int] = None
+    ) -> List[List[float]]:
+        """Run inference locally or on the embedding server (no caching)"""
+        if self.is_remote:
+            return self._remote_encode(texts)
+
         if self.model is None:
             self._load_model()
 
-        embeddings = self.model.encode(texts, convert_to_numpy=True)
-        return [emb.tolist() for emb in embeddings]
+        return self.model.encode(texts, batch_size).tolist()
+
+    async def aembed_text(self, text: str) -> List[float]:
+        """
+        Async variant of embed_text. Cache misses from concurrent callers are
+        micro-batched into one forward pass on the embedding executor.
+        """
+        cached = self.cache.get(self.model_id, text, shared=False)
+        if cached is not None:
+            return cached
+
+        if self.query_batching:
+            return (await self.query_batcher.embed([text]))[0]
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.embed_text, text)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Async variant of embed_queries (one batched pass for cache misses)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.embed_queries, texts)
+
+    async def aclose(self):
+        """Stop the query batching loop"""
+        await self.query_batcher.stop()
+
+    async def aembed_texts(
+        self, texts: List[str], batch_size: Optional[int] = None
+    ) -> List[List[float]]:
+        """Async variant of embed_texts that runs inference on the embedding executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self.embed_texts, texts, batch_size
+        )
 
     def get_embedding_dimension(self) -> int:
         """Get the dimension of embeddings produced by this model"""
+        if self.is_remote:
+            if self._server_dimension is None:
+                self._server_dimension = self._server_health()["dimension"]
+            return self._server_dimension
+
         if self.model is None:
             self._load_model()
 
-        return self.model.get_sentence_embedding_dimension()
+        return self.model.get_dimension()
 
 
 # Global embedding service instance
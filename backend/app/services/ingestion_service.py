@@ -0,0 +1,368 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Dict, List, Optional
+from sqlalchemy import insert, literal, select
+import hashlib
+import threading
+import time
+import os
+from dotenv import load_dotenv
+
+from app.models.database import SessionLocal
+from app.models.document import Document, DocumentChunk
+from app.services.document_processor import DocumentProcessor
+from app.services.embedding_service import embedding_service
+from app.services.answer_cache import answer_cache
+from app.utils import metrics
+from app.utils.timing import StageTimings, timed_iter
+
+load_dotenv()
+
+INGESTION_STAGE_SECONDS = metrics.histogram(
+    "ingestion_stage_seconds",
+    "Time spent per document in each ingestion stage (dedupe, extract, chunk, embed, insert)",
+    labelnames=("stage",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+
+# Bump when chunking changes in a way that alters chunk text, so documents
+# ingested before are no longer copied for identical uploads
+CHUNKER_VERSION = "1"
+
+
+def chunk_hash(model_id: str, text: str) -> str:
+    """Key for reusing a chunk's embedding: same model and same text"""
+    return hashlib.sha256(f"{model_id}\0{text}".encode("utf-8")).hexdigest()
+
+
+class IngestionService:
+    """
+    Background worker pool that extracts, chunks and embeds uploaded documents.
+
+    The documents table doubles as the job queue: a document with processed=0
+    is pending, and a worker claims it by atomically moving it to processed=1.
+    This keeps several uvicorn workers from processing the same document and
+    lets pending jobs be recovered after a restart.
+
+    Uploads whose bytes were already ingested with the same chunking and
+    embedding configuration are copied from the earlier document with one
+    INSERT ... SELECT; otherwise chunks whose text was embedded before
+    reuse the stored embedding and only new chunks are run through the model.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        if max_workers is None:
+            max_workers = int(os.getenv("INGESTION_WORKERS", "2"))
+
+        self.max_workers = max_workers
+        # Chunks embedded and inserted per round trip (progress is committed per batch)
+        self.batch_size = int(os.getenv("INGESTION_BATCH_SIZE", "256"))
+        self.stale_after = timedelta(
+            seconds=int(os.getenv("INGESTION_STALE_SECONDS", "600"))
+        )
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker pool"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="ingestion",
+                )
+
+    def shutdown(self, wait: bool = False):
+        """Stop the worker pool; unfinished jobs are recovered on next start"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+                self._executor = None
+
+    def enqueue(self, document_id: int):
+        """Schedule a pending document for processing"""
+        self.start()
+        self._executor.submit(self._run, document_id)
+
+    def recover_pending(self) -> int:
+        """
+        Re-enqueue pending documents and documents whose worker stopped
+        sending heartbeats (e.g. the process was killed mid-ingestion)
+        Returns: Number of documents enqueued
+        """
+        db = SessionLocal()
+        try:
+            stale_before = datetime.utcnow() - self.stale_after
+            db.query(Document).filter(
+                Document.processed == 1,
+                (Document.heartbeat_at.is_(None)) | (Document.heartbeat_at < stale_before),
+            ).update({Document.processed: 0}, synchronize_session=False)
+            db.commit()
+
+            pending_ids = [
+                doc_id
+                for (doc_id,) in db.query(Document.id)
+                .filter(Document.processed == 0)
+                .order_by(Document.id)
+                .all()
+            ]
+        finally:
+            db.close()
+
+        for document_id in pending_ids:
+            self.enqueue(document_id)
+
+        return len(pending_ids)
+
+    def _claim(self, db, document_id: int) -> bool:
+        """Atomically move a document from pending to processing"""
+        claimed = (
+            db.query(Document)
+            .filter(Document.id == document_id, Document.processed == 0)
+            .update(
+                {
+                    Document.processed: 1,
+                    Document.chunks_total: None,
+                    Document.chunks_processed: 0,
+                    Document.pages_total: None,
+                    Document.pages_processed: None,
+                    Document.chunk_count: 0,
+                    Document.processing_error: None,
+                    Document.heartbeat_at: datetime.utcnow(),
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        return claimed == 1
+
+    def _run(self, document_id: int):
+        """Process a single document (runs on a worker thread)"""
+        db = SessionLocal()
+        try:
+            if not self._claim(db, document_id):
+                return
+
+            try:
+                self.process(db, document_id)
+            except Exception as e:
+                db.rollback()
+                db.query(Document).filter(Document.id == document_id).update(
+                    {Document.processed: -1, Document.processing_error: str(e)},
+                    synchronize_session=False,
+                )
+                db.commit()
+                print(f"Error processing document {document_id}: {e}")
+        finally:
+            db.close()
+
+    def process(self, db, document_id: int):
+        """Extract, chunk and embed a claimed document"""
+        document = db.get(Document, document_id)
+        if document is None:
+            return
+
+        # Drop chunks (and answers generated from them) left over from an
+        # earlier attempt
+        answer_cache.invalidate_document(document.user_id, document.id)
+        db.query(DocumentChunk).filter(
+            DocumentChunk.document_id == document_id
+        ).delete(synchronize_session=False)
+
+        processor = DocumentProcessor()
+        document.ingest_signature = self.ingest_signature(processor)
+        db.commit()
+
+        started = time.perf_counter()
+        timings = StageTimings()
+        with timings.measure("dedupe"):
+            copied = self.copy_duplicate(db, document)
+        if copied:
+            elapsed = time.perf_counter() - started
+            print(
+                f"Ingested document {document.id}: copied {document.chunks_total} chunks "
+                f"of an identical upload in {elapsed:.2f}s"
+            )
+        else:
+            # Stream pages -> chunks -> bounded embedding batches -> bulk
+            # inserts, so memory stays flat regardless of document size. The
+            # chunk total is only known once extraction finishes; until then
+            # PDFs report page progress.
+            pages = timed_iter(
+                processor.iter_pages(document.file_path, document.file_type),
+                timings,
+                "extract",
+            )
+            chunks = timed_iter(
+                processor.iter_split(pages), timings, "chunk", exclude="extract"
+            )
+            reused = 0
+            while True:
+                batch = list(islice(chunks, self.batch_size))
+                if not batch:
+                    break
+                if len(batch) < self.batch_size:
+                    # The chunk iterator is exhausted: the total is known
+                    # before the last batch is embedded
+                    document.chunks_total = document.chunks_processed + len(batch)
+                    db.commit()
+
+                hashes = [
+                    chunk_hash(embedding_service.model_id, chunk_text)
+                    for chunk_text, _, _ in batch
+                ]
+                with timings.measure("embed"):
+                    embeddings = self.embed_batch(db, [text for text, _, _ in batch], hashes)
+                reused += sum(1 for embedding in embeddings if embedding["reused"])
+
+                # Single executemany round trip instead of one INSERT per chunk
+                with timings.measure("insert"):
+                    db.execute(
+                        insert(DocumentChunk),
+                        [
+                            {
+                                "document_id": document.id,
+                                "user_id": document.user_id,
+                                "chunk_index": chunk_idx,
+                                "chunk_text": chunk_text,
+                                "page_number": page_num,
+                                "embedding": embedding["embedding"],
+                                "content_hash": content_hash,
+                            }
+                            for (chunk_text, page_num, chunk_idx), embedding, content_hash in zip(
+                                batch, embeddings, hashes
+                            )
+                        ],
+                    )
+                    document.chunks_processed += len(batch)
+                    document.chunk_count = document.chunks_processed
+                    if processor.page_count:
+                        document.pages_total = processor.page_count
+                        document.pages_processed = batch[-1][1]
+                    document.heartbeat_at = datetime.utcnow()
+                    db.commit()
+
+            document.chunks_total = document.chunks_processed
+
+            elapsed = time.perf_counter() - started
+            rate = document.chunks_total / elapsed if elapsed > 0 else 0.0
+            stages = ", ".join(
+                f"{name} {seconds:.2f}s" for name, seconds in timings.stages.items()
+            )
+            print(
+                f"Ingested document {document.id}: {document.chunks_total} chunks "
+                f"({reused} reused embeddings) in {elapsed:.2f}s ({rate:.1f} chunks/sec; {stages})"
+            )
+            if document.file_type == "pdf":
+                print(f"PDF extraction for document {document.id}: {processor.page_timing_stats()}")
+
+        document.processed = 2  # Completed
+        document.heartbeat_at = datetime.utcnow()
+        db.commit()
+
+        for name, seconds in timings.stages.items():
+            INGESTION_STAGE_SECONDS.observe(seconds, stage=name)
+
+    def ingest_signature(self, processor: DocumentProcessor) -> str:
+        """Hash of the configuration that determines a document's chunks and embeddings"""
+        config = (
+            f"{CHUNKER_VERSION}:{processor.chunk_size}:{processor.chunk_overlap}:"
+            f"{embedding_service.model_id}"
+        )
+        return hashlib.sha256(config.encode("utf-8")).hexdigest()
+
+    def copy_duplicate(self, db, document: Document) -> bool:
+        """
+        Copy chunks and embeddings from a completed document with the same
+        content hash and ingest signature (possibly another user's upload)
+        Returns: Whether the document was fully copied
+        """
+        if not document.content_hash:
+            return False
+
+        source = (
+            db.query(Document.id, Document.chunks_total)
+            .filter(
+                Document.content_hash == document.content_hash,
+                Document.ingest_signature == document.ingest_signature,
+                Document.processed == 2,
+                Document.id != document.id,
+            )
+            .order_by(Document.id.desc())
+            .first()
+        )
+        if source is None:
+            return False
+
+        columns = [
+            "document_id",
+            "user_id",
+            "chunk_index",
+            "chunk_text",
+            "page_number",
+            "embedding",
+            "content_hash",
+            "created_at",
+        ]
+        copied = db.execute(
+            insert(DocumentChunk).from_select(
+                columns,
+                select(
+                    literal(document.id),
+                    literal(document.user_id),
+                    DocumentChunk.chunk_index,
+                    DocumentChunk.chunk_text,
+                    DocumentChunk.page_number,
+                    DocumentChunk.embedding,
+                    DocumentChunk.content_hash,
+                    literal(datetime.utcnow()),
+                ).where(DocumentChunk.document_id == source.id),
+            )
+        ).rowcount
+
+        # The source may have been deleted or re-processed meanwhile
+        if source.chunks_total is None or copied != source.chunks_total:
+            db.rollback()
+            return False
+
+        document.chunks_processed = copied
+        document.chunks_total = copied
+        document.chunk_count = copied
+        document.heartbeat_at = datetime.utcnow()
+        db.commit()
+        return True
+
+    def embed_batch(self, db, texts: List[str], hashes: List[str]) -> List[Dict]:
+        """
+        Embeddings for a batch of chunks, reusing stored embeddings of
+        identical chunks and encoding only the rest
+        Returns: One {"embedding", "reused"} dict per text
+        """
+        stored = {
+            content_hash: embedding
+            for content_hash, embedding in db.query(
+                DocumentChunk.content_hash, DocumentChunk.embedding
+            )
+            .filter(
+                DocumentChunk.content_hash.in_(set(hashes)),
+                DocumentChunk.embedding.isnot(None),
+            )
+            .distinct(DocumentChunk.content_hash)
+            .all()
+        }
+
+        missing = [i for i, content_hash in enumerate(hashes) if content_hash not in stored]
+        encoded = embedding_service.embed_texts([texts[i] for i in missing])
+
+        results = [
+            {"embedding": stored.get(content_hash), "reused": content_hash in stored}
+            for content_hash in hashes
+        ]
+        for i, embedding in zip(missing, encoded):
+            results[i]["embedding"] = embedding
+        return results
+
+
+# Global ingestion service instance
+ingestion_service = IngestionService()
@@ -0,0 +1,45 @@
+from typing import List, Sequence
+import numpy as np
+
+
+def mmr_select(
+    query_embedding: Sequence[float],
+    embeddings: Sequence[Sequence[float]],
+    top_k: int,
+    lambda_mult: float = 0.5,
+) -> List[int]:
+    """
+    Maximal marginal relevance: greedily pick the candidate maximizing
+    lambda * sim(query, c) - (1 - lambda) * max sim(c, selected).
+    lambda_mult=1 is pure relevance, 0 is pure diversity.
+    Returns: Indexes of the selected candidates, in selection order
+    """
+    if top_k <= 0 or len(embeddings) == 0:
+        return []
+
+    candidates = np.asarray(embeddings, dtype=np.float32)
+    candidates = candidates / np.clip(
+        np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12, None
+    )
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+
+    first = int(np.argmax(relevance))
+    selected = [first]
+    # Highest similarity of each candidate to anything already selected
+    redundancy = similarity[first].copy()
+    available = np.ones(len(candidates), dtype=bool)
+    available[first] = False
+
+    while len(selected) < min(top_k, len(candidates)):
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+
+    return selected
@@ -1,16 +1,120 @@
-from typing import List, Dict, Optional
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, bindparam, text
+from pgvector.sqlalchemy import Vector
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import hashlib
 import httpx
+import json
 import os
 from dotenv import load_dotenv
 
-from app.models.document import DocumentChunk
+from app.models.database import session_scope, set_vector_search_params
+from app.models.document import DocumentChunk, TEXT_SEARCH_CONFIG
 from app.models.user import User
 from app.services.embedding_service import embedding_service
+from app.services.answer_cache import answer_cache
+from app.services.reranker_service import reranker_service
+from app.services.context_packer import context_packer
+from app.services.mmr import mmr_select
+from app.utils import metrics
+from app.utils.timing import stage
 
 load_dotenv()
 
+OPENAI_BASE_URL = "https://api.openai.com"
+ANTHROPIC_BASE_URL = "https://api.anthropic.com"
+
+# Retrieval modes: "vector" (cosine distance only) or "hybrid" (vector and
+# full-text candidates fused with reciprocal rank fusion)
+RETRIEVAL_MODES = ("vector", "hybrid")
+DEFAULT_RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector").lower()
+# RRF constant: larger values flatten the advantage of top-ranked candidates
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Each side of a hybrid search contributes top_k * this many candidates
+HYBRID_CANDIDATE_MULTIPLIER = int(os.getenv("HYBRID_CANDIDATE_MULTIPLIER", "4"))
+# MMR picks top_k from a pool of top_k * this many candidates
+MMR_CANDIDATE_MULTIPLIER = int(os.getenv("MMR_CANDIDATE_MULTIPLIER", "4"))
+# Concurrent LLM calls per /query/batch request
+QUERY_BATCH_CONCURRENCY = int(os.getenv("QUERY_BATCH_CONCURRENCY", "4"))
+
+# Per-query values are substituted as {placeholders} so the same search can
+# run for one query (bind parameters) or for a batch (columns of a VALUES
+# list joined LATERAL)
+HYBRID_SEARCH_SQL = """
+WITH vector_hits AS (
+    SELECT id, embedding <=> {embedding} AS distance
+    FROM document_chunks
+    WHERE user_id = :user_id AND embedding IS NOT NULL {document_filter}
+    ORDER BY distance
+    LIMIT {candidates}
+),
+vector_ranked AS (
+    SELECT id, ROW_NUMBER() OVER (ORDER BY distance) AS rank FROM vector_hits
+),
+lexical_hits AS (
+    SELECT id, ts_rank_cd(chunk_tsv, ts_query) AS score
+    FROM document_chunks, websearch_to_tsquery(CAST(:ts_config AS regconfig), {query}) AS ts_query
+    WHERE user_id = :user_id AND chunk_tsv @@ ts_query {document_filter} {lexical_filter}
+    ORDER BY score DESC
+    LIMIT {candidates}
+),
+lexical_ranked AS (
+    SELECT id, ROW_NUMBER() OVER (ORDER BY score DESC) AS rank FROM lexical_hits
+),
+fused AS (
+    SELECT
+        COALESCE(v.id, l.id) AS id,
+        COALESCE({vector_weight} / (:rrf_k + v.rank), 0)
+            + COALESCE({lexical_weight} / (:rrf_k + l.rank), 0) AS score
+    FROM vector_ranked v
+    FULL OUTER JOIN lexical_ranked l ON v.id = l.id
+)
+SELECT
+    c.id, c.document_id, c.chunk_index, c.chunk_text, c.page_number,
+    1 - (c.embedding <=> {embedding}) AS similarity,{embedding_column}
+    f.score
+FROM fused f
+JOIN document_chunks c ON c.id = f.id
+ORDER BY f.score DESC, c.id
+LIMIT {top_k}
+"""
+
+# Retrieval for several queries in one statement: one VALUES row per query,
+# each searched by the hybrid query as a LATERAL subquery. Vector-only
+# queries have lexical_weight 0, which skips their full-text scan.
+BATCH_SEARCH_SQL = """
+SELECT q.ord, r.*
+FROM (VALUES {values}) AS q(ord, embedding, query, candidates, top_k, document_ids, vector_weight, lexical_weight)
+CROSS JOIN LATERAL ({search}) AS r
+ORDER BY q.ord, r.score DESC, r.id
+"""
+
+RAG_STAGE_SECONDS = metrics.histogram(
+    "rag_stage_seconds",
+    "Time spent per query stage (embed, retrieve, rerank, pack, prompt, llm)",
+    labelnames=("stage",),
+)
+LLM_REQUESTS = metrics.counter(
+    "llm_requests_total", "LLM calls by provider", labelnames=("provider",)
+)
+LLM_ERRORS = metrics.counter(
+    "llm_errors_total", "Failed LLM calls by provider", labelnames=("provider",)
+)
+LLM_TOKENS = metrics.counter(
+    "llm_tokens_total",
+    "LLM tokens reported by the provider, by kind (prompt or completion)",
+    labelnames=("provider", "kind"),
+)
+
+NO_DOCUMENTS_ANSWER = (
+    "I don't have any relevant documents to answer this question. "
+    "Please upload documents first."
+)
+
 
 class RAGService:
     """Service for RAG query processing"""
@@ -19,19 +123,174 @@ class RAGService:
         self.default_llm_provider = os.getenv("DEFAULT_LLM_PROVIDER", "openai")
         self.default_model = os.getenv("DEFAULT_MODEL", "gpt-3.5-turbo")
 
+        # Identifies the prompt template in answer cache keys, so editing
+        # build_prompt invalidates previously cached answers
+        self.prompt_template_id = hashlib.sha256(
+            self.build_prompt("{query}", "{context}").encode("utf-8")
+        ).hexdigest()[:16]
+
+        # Long-lived HTTP clients, one connection pool per LLM base URL
+        self.http_timeout = httpx.Timeout(
+            float(os.getenv("LLM_HTTP_TIMEOUT", "60")),
+            connect=float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "10")),
+        )
+        self.http_limits = httpx.Limits(
+            max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "30")),
+        )
+        self.http2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+        if self.http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                print("Warning: h2 is not installed, LLM clients will use HTTP/1.1")
+                self.http2 = False
+        # Bounds the number of pools kept for user-configured custom endpoints
+        self.max_http_clients = int(os.getenv("LLM_HTTP_MAX_CLIENTS", "32"))
+        self._http_clients: "OrderedDict[str, httpx.AsyncClient]" = OrderedDict()
+
+    def get_http_client(self, base_url: str) -> httpx.AsyncClient:
+        """Get (or create) the pooled HTTP client for an LLM base URL"""
+        base_url = base_url.rstrip("/")
+        client = self._http_clients.get(base_url)
+        if client is not None and not client.is_closed:
+            self._http_clients.move_to_end(base_url)
+            return client
+
+        client = httpx.AsyncClient(
+            base_url=base_url,
+            http2=self.http2,
+            limits=self.http_limits,
+            timeout=self.http_timeout,
+        )
+        self._http_clients[base_url] = client
+
+        # Evict the least recently used pool; close it once in-flight
+        # requests have had time to finish
+        while len(self._http_clients) > self.max_http_clients:
+            _, evicted = self._http_clients.popitem(last=False)
+            asyncio.get_running_loop().call_later(
+                self.http_timeout.read or 60.0,
+                lambda c=evicted: asyncio.ensure_future(c.aclose()),
+            )
+
+        return client
+
+    async def aclose(self):
+        """Close all pooled HTTP clients (called on app shutdown)"""
+        clients = list(self._http_clients.values())
+        self._http_clients.clear()
+        for client in clients:
+            await client.aclose()
+
     async def retrieve_relevant_chunks(
         self,
-        db: Session,
         user_id: int,
         query: str,
         top_k: int = 5,
         document_ids: Optional[List[int]] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        query_embedding: Optional[List[float]] = None,
+        retrieval_mode: Optional[str] = None,
+        vector_weight: float = 1.0,
+        lexical_weight: float = 1.0,
+        mmr_lambda: Optional[float] = None,
+    ) -> List[Dict]:
+        """
+        Retrieve relevant document chunks using vector similarity search,
+        optionally fused with full-text search (retrieval_mode="hybrid").
+        With mmr_lambda set, top_k is chosen from a larger candidate pool by
+        maximal marginal relevance to avoid near-duplicate chunks.
+        """
+        # Generate query embedding on the inference executor, then run the
+        # synchronous database search on the threadpool in its own
+        # short-lived session
+        if query_embedding is None:
+            with stage(RAG_STAGE_SECONDS, "embed"):
+                query_embedding = await embedding_service.aembed_text(query)
+
+        use_mmr = mmr_lambda is not None
+        fetch_k = top_k * MMR_CANDIDATE_MULTIPLIER if use_mmr else top_k
+
+        with stage(RAG_STAGE_SECONDS, "retrieve"):
+            if (retrieval_mode or DEFAULT_RETRIEVAL_MODE) == "hybrid":
+                chunks = await run_in_threadpool(
+                    self.run_search,
+                    self.search_chunks_hybrid,
+                    user_id,
+                    query,
+                    query_embedding,
+                    fetch_k,
+                    document_ids,
+                    ef_search,
+                    probes,
+                    vector_weight,
+                    lexical_weight,
+                    use_mmr,
+                )
+            else:
+                chunks = await run_in_threadpool(
+                    self.run_search,
+                    self.search_chunks,
+                    user_id,
+                    query_embedding,
+                    fetch_k,
+                    document_ids,
+                    ef_search,
+                    probes,
+                    use_mmr,
+                )
+            if use_mmr:
+                chunks = self.diversify(query_embedding, chunks, top_k, mmr_lambda)
+
+        return chunks
+
+    def run_search(self, search, *args):
+        """
+        Run a search function with a session that is closed as soon as it
+        returns, so no pooled connection is held while the LLM answers
+        """
+        with session_scope() as db:
+            return search(db, *args)
+
+    def diversify(
+        self, query_embedding: List[float], chunks: List[Dict], top_k: int, mmr_lambda: float
+    ) -> List[Dict]:
+        """
+        Select top_k of the candidates (which carry their embeddings) by MMR
+        Returns: Selected chunks without embeddings
+        """
+        candidates = [chunk for chunk in chunks if chunk.get("embedding") is not None]
+        selected = mmr_select(
+            query_embedding,
+            [chunk["embedding"] for chunk in candidates],
+            top_k,
+            mmr_lambda,
+        )
+        results = []
+        for index in selected:
+            chunk = dict(candidates[index])
+            del chunk["embedding"]
+            results.append(chunk)
+        return results
+
+    def search_chunks(
+        self,
+        db: Session,
+        user_id: int,
+        query_embedding: List[float],
+        top_k: int = 5,
+        document_ids: Optional[List[int]] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        include_embeddings: bool = False,
     ) -> List[Dict]:
         """
-        Retrieve relevant document chunks using vector similarity search
+        Vector similarity search for a precomputed query embedding (blocking)
         """
-        # Generate query embedding
-        query_embedding = embedding_service.embed_text(query)
+        set_vector_search_params(db, ef_search=ef_search, probes=probes, candidates=top_k)
 
         # Build filter conditions
         filters = [DocumentChunk.user_id == user_id]
@@ -54,29 +313,197 @@ class RAGService:
             .all()
         )
 
-        # Format results
+        # Format results (re-sorted: IVFFlat iterative scans only keep a
+        # relaxed order)
         results = []
-        for chunk, distance in chunks:
-            results.append(
+        for chunk, distance in sorted(chunks, key=lambda row: row[1]):
+            result = {
+                "chunk_id": chunk.id,
+                "document_id": chunk.document_id,
+                "chunk_index": chunk.chunk_index,
+                "text": chunk.chunk_text,
+                "page_number": chunk.page_number,
+                "similarity": 1 - distance,  # Convert distance to similarity
+            }
+            if include_embeddings:
+                result["embedding"] = chunk.embedding
+            results.append(result)
+
+        return results
+
+    def search_chunks_hybrid(
+        self,
+        db: Session,
+        user_id: int,
+        query: str,
+        query_embedding: List[float],
+        top_k: int = 5,
+        document_ids: Optional[List[int]] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        vector_weight: float = 1.0,
+        lexical_weight: float = 1.0,
+        include_embeddings: bool = False,
+    ) -> List[Dict]:
+        """
+        Hybrid search in one round-trip: the nearest vector candidates and
+        the best ts_rank_cd full-text candidates are fused with weighted
+        reciprocal rank fusion (blocking)
+        """
+        candidates = top_k * HYBRID_CANDIDATE_MULTIPLIER
+        set_vector_search_params(db, ef_search=ef_search, probes=probes, candidates=candidates)
+
+        params = {
+            "user_id": user_id,
+            "query": query,
+            "ts_config": TEXT_SEARCH_CONFIG,
+            "embedding": query_embedding,
+            "candidates": candidates,
+            "vector_weight": float(vector_weight),
+            "lexical_weight": float(lexical_weight),
+            "rrf_k": RRF_K,
+            "top_k": top_k,
+        }
+        document_filter = ""
+        if document_ids:
+            document_filter = "AND document_id = ANY(:document_ids)"
+            params["document_ids"] = list(document_ids)
+
+        statement = (
+            text(
+                HYBRID_SEARCH_SQL.format(
+                    embedding=":embedding",
+                    query=":query",
+                    candidates=":candidates",
+                    top_k=":top_k",
+                    vector_weight=":vector_weight",
+                    lexical_weight=":lexical_weight",
+                    document_filter=document_filter,
+                    lexical_filter="",
+                    embedding_column=" c.embedding," if include_embeddings else "",
+                )
+            )
+            .bindparams(bindparam("embedding", type_=Vector()))
+            .columns(embedding=Vector())
+        )
+
+        return [
+            self._chunk_from_row(row, include_embeddings)
+            for row in db.execute(statement, params)
+        ]
+
+    def _chunk_from_row(self, row, include_embeddings: bool = False) -> Dict:
+        """Format a row of a hybrid/batch search as a retrieved chunk"""
+        result = {
+            "chunk_id": row.id,
+            "document_id": row.document_id,
+            "chunk_index": row.chunk_index,
+            "text": row.chunk_text,
+            "page_number": row.page_number,
+            "similarity": float(row.similarity) if row.similarity is not None else 0.0,
+            "score": float(row.score),  # fused RRF score
+        }
+        if include_embeddings:
+            result["embedding"] = row.embedding
+        return result
+
+    def search_chunks_batch(
+        self,
+        db: Session,
+        user_id: int,
+        searches: List[Dict],
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        include_embeddings: bool = False,
+    ) -> List[List[Dict]]:
+        """
+        Retrieve chunks for several queries in a single statement (blocking).
+        Each search is a dict with query, embedding, top_k, document_ids,
+        vector_weight and lexical_weight (0 for vector-only retrieval).
+        Returns: One list of chunks per search, in order
+        """
+        max_candidates = max(search["top_k"] for search in searches) * HYBRID_CANDIDATE_MULTIPLIER
+        set_vector_search_params(
+            db, ef_search=ef_search, probes=probes, candidates=max_candidates
+        )
+
+        params = {"user_id": user_id, "ts_config": TEXT_SEARCH_CONFIG, "rrf_k": RRF_K}
+        values = []
+        embedding_params = []
+        for i, search in enumerate(searches):
+            values.append(
+                f"(CAST(:ord_{i} AS integer), CAST(:embedding_{i} AS vector), "
+                f"CAST(:query_{i} AS text), CAST(:candidates_{i} AS integer), "
+                f"CAST(:top_k_{i} AS integer), CAST(:document_ids_{i} AS integer[]), "
+                f"CAST(:vector_weight_{i} AS float8), CAST(:lexical_weight_{i} AS float8))"
+            )
+            embedding_params.append(bindparam(f"embedding_{i}", type_=Vector()))
+            params.update(
                 {
-                    "chunk_id": chunk.id,
-                    "document_id": chunk.document_id,
-                    "text": chunk.chunk_text,
-                    "page_number": chunk.page_number,
-                    "similarity": 1 - distance,  # Convert distance to similarity
+                    f"ord_{i}": i,
+                    f"embedding_{i}": search["embedding"],
+                    f"query_{i}": search["query"],
+                    f"candidates_{i}": search["top_k"] * HYBRID_CANDIDATE_MULTIPLIER,
+                    f"top_k_{i}": search["top_k"],
+                    f"document_ids_{i}": list(search["document_ids"]) if search.get("document_ids") else None,
+                    f"vector_weight_{i}": float(search["vector_weight"]),
+                    f"lexical_weight_{i}": float(search["lexical_weight"]),
                 }
             )
 
+        search_sql = HYBRID_SEARCH_SQL.format(
+            embedding="q.embedding",
+            query="q.query",
+            candidates="q.candidates",
+            top_k="q.top_k",
+            vector_weight="q.vector_weight",
+            lexical_weight="q.lexical_weight",
+            document_filter="AND (q.document_ids IS NULL OR document_id = ANY(q.document_ids))",
+            lexical_filter="AND q.lexical_weight > 0",
+            embedding_column=" c.embedding," if include_embeddings else "",
+        )
+        statement = (
+            text(BATCH_SEARCH_SQL.format(values=", ".join(values), search=search_sql))
+            .bindparams(*embedding_params)
+            .columns(embedding=Vector())
+        )
+
+        results = [[] for _ in searches]
+        for row in db.execute(statement, params):
+            results[row.ord].append(self._chunk_from_row(row, include_embeddings))
         return results
 
+    async def rerank_chunks(self, query: str, chunks: List[Dict], top_k: int) -> List[Dict]:
+        """
+        Rerank over-fetched candidates with the cross-encoder, keeping the
+        retrieval order if reranking is skipped
+        Returns: At most top_k chunks
+        """
+        with stage(RAG_STAGE_SECONDS, "rerank"):
+            reranked = await reranker_service.rerank(query, chunks, top_k)
+        return reranked if reranked is not None else chunks[:top_k]
+
+    def format_context_block(self, number: int, chunk: Dict) -> str:
+        """Render one numbered source as it appears in the context"""
+        page_info = f", Page {chunk['page_number']}" if chunk["page_number"] else ""
+        return f"[Source {number}]{page_info}:\n{chunk['text']}\n"
+
+    def pack_context(self, user: User, chunks: List[Dict]) -> Tuple[List[Dict], int]:
+        """
+        Merge, dedupe and trim retrieved chunks to the token budget of the
+        user's LLM (see ContextPacker). Blocking: run it on the threadpool.
+        Returns: (context blocks, context token count)
+        """
+        with stage(RAG_STAGE_SECONDS, "pack"):
+            return context_packer.pack(
+                chunks, self.resolve_llm(user)["model"], self.format_context_block
+            )
+
     def build_context(self, chunks: List[Dict]) -> str:
-        """Build context string from retrieved chunks"""
+        """Build context string from retrieved (or packed) chunks"""
         context_parts = []
         for i, chunk in enumerate(chunks, 1):
-            page_info = f", Page {chunk['page_number']}" if chunk["page_number"] else ""
-            context_parts.append(
-                f"[Source {i}]{page_info}:\n{chunk['text']}\n"
-            )
+            context_parts.append(self.format_context_block(i, chunk))
 
         return "\n".join(context_parts)
 
@@ -113,15 +540,16 @@ Answer:"""
                 "temperature": 0.7,
             }
 
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    "https://api.openai.com/v1/chat/completions",
-                    headers=headers,
-                    json=data,
-                )
-                response.raise_for_status()
-                result = response.json()
-                return result["choices"][0]["message"]["content"]
+            client = self.get_http_client(OPENAI_BASE_URL)
+            response = await client.post(
+                "/v1/chat/completions",
+                headers=headers,
+                json=data,
+            )
+            response.raise_for_status()
+            result = response.json()
+            self.record_usage("openai", result.get("usage"))
+            return result["choices"][0]["message"]["content"]
         except Exception as e:
             raise Exception(f"OpenAI API error: {str(e)}")
 
@@ -141,15 +569,16 @@ Answer:"""
                 "messages": [{"role": "user", "content": prompt}],
             }
 
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    "https://api.anthropic.com/v1/messages",
-                    headers=headers,
-                    json=data,
-                )
-                response.raise_for_status()
-                result = response.json()
-                return result["content"][0]["text"]
+            client = self.get_http_client(ANTHROPIC_BASE_URL)
+            response = await client.post(
+                "/v1/messages",
+                headers=headers,
+                json=data,
+            )
+            response.raise_for_status()
+            result = response.json()
+            self.record_usage("anthropic", result.get("usage"))
+            return result["content"][0]["text"]
         except Exception as e:
             raise Exception(f"Anthropic API error: {str(e)}")
 
@@ -168,22 +597,140 @@ Answer:"""
                 "temperature": 0.7,
             }
 
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    f"{endpoint}/v1/chat/completions",
-                    headers=headers,
-                    json=data,
-                )
+            client = self.get_http_client(endpoint)
+            response = await client.post(
+                "/v1/chat/completions",
+                headers=headers,
+                json=data,
+            )
+            response.raise_for_status()
+            result = response.json()
+            self.record_usage("custom", result.get("usage"))
+            return result["choices"][0]["message"]["content"]
+        except Exception as e:
+            raise Exception(f"Custom endpoint error: {str(e)}")
+
+    async def _iter_sse_data(self, response: httpx.Response) -> AsyncIterator[Dict]:
+        """Yield the JSON payloads of a Server-Sent Events response"""
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            payload = line[len("data:"):].strip()
+            if payload == "[DONE]":
+                break
+            if payload:
+                yield json.loads(payload)
+
+    async def _stream_chat_completions(
+        self, base_url: str, headers: Dict, data: Dict, provider: str
+    ) -> AsyncIterator[str]:
+        """Stream content deltas from an OpenAI-compatible chat completions API"""
+        client = self.get_http_client(base_url)
+        async with client.stream(
+            "POST", "/v1/chat/completions", headers=headers, json={**data, "stream": True}
+        ) as response:
+            response.raise_for_status()
+            async for event in self._iter_sse_data(response):
+                self.record_usage(provider, event.get("usage"))
+                choices = event.get("choices") or []
+                if choices:
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+
+    async def stream_openai(
+        self, api_key: str, model: str, prompt: str
+    ) -> AsyncIterator[str]:
+        """Stream an answer from the OpenAI API"""
+        try:
+            headers = {
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+            }
+            data = {
+                "model": model,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": 0.7,
+                # The last chunk then reports token usage
+                "stream_options": {"include_usage": True},
+            }
+
+            async with aclosing(
+                self._stream_chat_completions(OPENAI_BASE_URL, headers, data, "openai")
+            ) as deltas:
+                async for delta in deltas:
+                    yield delta
+        except Exception as e:
+            raise Exception(f"OpenAI API error: {str(e)}")
+
+    async def stream_anthropic(
+        self, api_key: str, model: str, prompt: str
+    ) -> AsyncIterator[str]:
+        """Stream an answer from the Anthropic API"""
+        try:
+            headers = {
+                "x-api-key": api_key,
+                "anthropic-version": "2023-06-01",
+                "Content-Type": "application/json",
+            }
+            data = {
+                "model": model,
+                "max_tokens": 4096,
+                "messages": [{"role": "user", "content": prompt}],
+                "stream": True,
+            }
+
+            client = self.get_http_client(ANTHROPIC_BASE_URL)
+            async with client.stream(
+                "POST", "/v1/messages", headers=headers, json=data
+            ) as response:
                 response.raise_for_status()
-                result = response.json()
-                return result["choices"][0]["message"]["content"]
+                async for event in self._iter_sse_data(response):
+                    if event.get("type") == "message_start":
+                        usage = event.get("message", {}).get("usage", {})
+                        self.record_usage("anthropic", {"input_tokens": usage.get("input_tokens")})
+                    elif event.get("type") == "message_delta":
+                        usage = event.get("usage", {})
+                        self.record_usage("anthropic", {"output_tokens": usage.get("output_tokens")})
+                    elif event.get("type") == "content_block_delta":
+                        text = event.get("delta", {}).get("text")
+                        if text:
+                            yield text
+                    elif event.get("type") == "message_stop":
+                        break
+                    elif event.get("type") == "error":
+                        raise Exception(event.get("error", {}).get("message", "stream error"))
+        except Exception as e:
+            raise Exception(f"Anthropic API error: {str(e)}")
+
+    async def stream_custom_endpoint(
+        self, endpoint: str, api_key: Optional[str], model: str, prompt: str
+    ) -> AsyncIterator[str]:
+        """Stream an answer from a custom LLM endpoint (OpenAI-compatible)"""
+        try:
+            headers = {"Content-Type": "application/json"}
+            if api_key:
+                headers["Authorization"] = f"Bearer {api_key}"
+
+            data = {
+                "model": model,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": 0.7,
+            }
+
+            async with aclosing(
+                self._stream_chat_completions(endpoint, headers, data, "custom")
+            ) as deltas:
+                async for delta in deltas:
+                    yield delta
         except Exception as e:
             raise Exception(f"Custom endpoint error: {str(e)}")
 
-    async def generate_answer(
-        self, user: User, prompt: str
-    ) -> str:
-        """Generate answer using user's configured LLM"""
+    def resolve_llm(self, user: User) -> Dict:
+        """
+        Resolve the user's LLM provider, model and credentials
+        Returns: Dict with provider, model, api_key and endpoint
+        """
         provider = user.preferred_llm_provider or self.default_llm_provider
         model = user.preferred_model or self.default_model
 
@@ -191,71 +738,369 @@ Answer:"""
             api_key = user.openai_api_key
             if not api_key:
                 raise Exception("OpenAI API key not configured")
-            return await self.call_openai(api_key, model, prompt)
+            endpoint = None
 
         elif provider == "anthropic":
             api_key = user.anthropic_api_key
             if not api_key:
                 raise Exception("Anthropic API key not configured")
-            return await self.call_anthropic(api_key, model, prompt)
+            endpoint = None
 
         elif provider == "custom":
             endpoint = user.custom_llm_endpoint
             api_key = user.custom_llm_api_key
             if not endpoint:
                 raise Exception("Custom LLM endpoint not configured")
-            return await self.call_custom_endpoint(endpoint, api_key, model, prompt)
 
         else:
             raise Exception(f"Unsupported LLM provider: {provider}")
 
+        return {"provider": provider, "model": model, "api_key": api_key, "endpoint": endpoint}
+
+    async def generate_answer(
+        self, user: User, prompt: str
+    ) -> str:
+        """Generate answer using user's configured LLM"""
+        llm = self.resolve_llm(user)
+
+        LLM_REQUESTS.inc(provider=llm["provider"])
+        try:
+            with stage(RAG_STAGE_SECONDS, "llm"):
+                if llm["provider"] == "openai":
+                    return await self.call_openai(llm["api_key"], llm["model"], prompt)
+                elif llm["provider"] == "anthropic":
+                    return await self.call_anthropic(llm["api_key"], llm["model"], prompt)
+                else:
+                    return await self.call_custom_endpoint(
+                        llm["endpoint"], llm["api_key"], llm["model"], prompt
+                    )
+        except Exception:
+            LLM_ERRORS.inc(provider=llm["provider"])
+            raise
+
+    def stream_answer(self, user: User, prompt: str) -> AsyncIterator[str]:
+        """Stream answer tokens from the user's configured LLM"""
+        llm = self.resolve_llm(user)
+
+        if llm["provider"] == "openai":
+            deltas = self.stream_openai(llm["api_key"], llm["model"], prompt)
+        elif llm["provider"] == "anthropic":
+            deltas = self.stream_anthropic(llm["api_key"], llm["model"], prompt)
+        else:
+            deltas = self.stream_custom_endpoint(
+                llm["endpoint"], llm["api_key"], llm["model"], prompt
+            )
+        return self._measure_stream(llm["provider"], deltas)
+
+    async def _measure_stream(
+        self, provider: str, deltas: AsyncIterator[str]
+    ) -> AsyncIterator[str]:
+        """Count a streamed LLM call and time it (until the last delta) as the llm stage"""
+        LLM_REQUESTS.inc(provider=provider)
+        try:
+            with stage(RAG_STAGE_SECONDS, "llm"):
+                async with aclosing(deltas):
+                    async for delta in deltas:
+                        yield delta
+        except Exception:
+            LLM_ERRORS.inc(provider=provider)
+            raise
+
+    def record_usage(self, provider: str, usage: Optional[Dict]):
+        """Count the token usage reported by an LLM API (OpenAI or Anthropic field names)"""
+        if not usage:
+            return
+        prompt_tokens = usage.get("prompt_tokens", usage.get("input_tokens"))
+        completion_tokens = usage.get("completion_tokens", usage.get("output_tokens"))
+        if prompt_tokens:
+            LLM_TOKENS.inc(prompt_tokens, provider=provider, kind="prompt")
+        if completion_tokens:
+            LLM_TOKENS.inc(completion_tokens, provider=provider, kind="completion")
+
+    def format_sources(self, chunks: List[Dict]) -> List[Dict]:
+        """Format retrieved chunks as numbered sources for the response"""
+        sources = []
+        for i, chunk in enumerate(chunks, 1):
+            sources.append(
+                {
+                    "source_number": i,
+                    "document_id": chunk["document_id"],
+                    "page_number": chunk["page_number"],
+                    "text_snippet": chunk["text"][:200] + "..."
+                    if len(chunk["text"]) > 200
+                    else chunk["text"],
+                    "similarity": round(chunk["similarity"], 4),
+                }
+            )
+        return sources
+
     async def query(
         self,
-        db: Session,
         user: User,
         query: str,
         top_k: int = 5,
         document_ids: Optional[List[int]] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        use_cache: bool = True,
+        retrieval_mode: Optional[str] = None,
+        vector_weight: float = 1.0,
+        lexical_weight: float = 1.0,
+        rerank: Optional[bool] = None,
+        mmr_lambda: Optional[float] = None,
     ) -> Dict:
         """
         Process RAG query
         Returns: Dict with answer and sources
         """
+        with stage(RAG_STAGE_SECONDS, "embed"):
+            query_embedding = await embedding_service.aembed_text(query)
+
         # Retrieve relevant chunks
+        rerank = reranker_service.enabled if rerank is None else rerank
+        fetch_k = reranker_service.candidate_count(top_k) if rerank else top_k
         chunks = await self.retrieve_relevant_chunks(
-            db, user.id, query, top_k, document_ids
+            user.id, query, fetch_k, document_ids, ef_search, probes,
+            query_embedding=query_embedding,
+            retrieval_mode=retrieval_mode,
+            vector_weight=vector_weight,
+            lexical_weight=lexical_weight,
+            mmr_lambda=mmr_lambda,
         )
+        if rerank:
+            chunks = await self.rerank_chunks(query, chunks, top_k)
+
+        return await self.answer_from_chunks(user, query, query_embedding, chunks, use_cache)
 
+    async def answer_from_chunks(
+        self,
+        user: User,
+        query: str,
+        query_embedding: List[float],
+        chunks: List[Dict],
+        use_cache: bool = True,
+    ) -> Dict:
+        """
+        Pack retrieved chunks and answer from the cache or the LLM
+        Returns: Dict with answer, sources, query, cached and context_tokens
+        """
         if not chunks:
             return {
-                "answer": "I don't have any relevant documents to answer this question. Please upload documents first.",
+                "answer": NO_DOCUMENTS_ANSWER,
                 "sources": [],
                 "query": query,
+                "cached": False,
+                "context_tokens": 0,
             }
 
+        # Fit the chunks to the model's context budget; sources are numbered
+        # as they appear in the context
+        chunks, context_tokens = await run_in_threadpool(self.pack_context, user, chunks)
+        sources = self.format_sources(chunks)
+
+        # Reuse an earlier answer generated from the same chunks and LLM
+        cache_scope = self.answer_cache_scope(user, chunks)
+        if use_cache:
+            cached = answer_cache.get(cache_scope, query, query_embedding)
+            if cached is not None:
+                return {
+                    "answer": cached["answer"],
+                    "sources": sources,
+                    "query": query,
+                    "cached": True,
+                    "context_tokens": context_tokens,
+                }
+
         # Build context and prompt
-        context = self.build_context(chunks)
-        prompt = self.build_prompt(query, context)
+        with stage(RAG_STAGE_SECONDS, "prompt"):
+            context = self.build_context(chunks)
+            prompt = self.build_prompt(query, context)
 
         # Generate answer
         answer = await self.generate_answer(user, prompt)
 
-        # Format sources
-        sources = []
-        for i, chunk in enumerate(chunks, 1):
-            sources.append(
+        answer_cache.set(
+            cache_scope, query, query_embedding, user.id,
+            [chunk["document_id"] for chunk in chunks], answer,
+        )
+
+        return {
+            "answer": answer,
+            "sources": sources,
+            "query": query,
+            "cached": False,
+            "context_tokens": context_tokens,
+        }
+
+    async def query_batch(self, user: User, queries: List[Dict]) -> List[Dict]:
+        """
+        Process several RAG queries: one batched embedding call, one
+        retrieval statement, then LLM calls concurrently (at most
+        QUERY_BATCH_CONCURRENCY at a time)
+        Each query is a dict of QueryRequest fields.
+        Returns: One result per query, in order; failed items carry an error
+        """
+        with stage(RAG_STAGE_SECONDS, "embed"):
+            query_embeddings = await embedding_service.aembed_queries(
+                [item["query"] for item in queries]
+            )
+
+        searches = []
+        for item, query_embedding in zip(queries, query_embeddings):
+            rerank = reranker_service.enabled if item.get("rerank") is None else item["rerank"]
+            top_k = item.get("top_k", 5)
+            fetch_k = reranker_service.candidate_count(top_k) if rerank else top_k
+            if item.get("mmr_lambda") is not None:
+                fetch_k *= MMR_CANDIDATE_MULTIPLIER
+            hybrid = (item.get("retrieval_mode") or DEFAULT_RETRIEVAL_MODE) == "hybrid"
+            searches.append(
                 {
-                    "source_number": i,
-                    "document_id": chunk["document_id"],
-                    "page_number": chunk["page_number"],
-                    "text_snippet": chunk["text"][:200] + "..."
-                    if len(chunk["text"]) > 200
-                    else chunk["text"],
-                    "similarity": round(chunk["similarity"], 4),
+                    "query": item["query"],
+                    "embedding": query_embedding,
+                    "top_k": fetch_k,
+                    "document_ids": item.get("document_ids"),
+                    "vector_weight": item.get("vector_weight", 1.0) if hybrid else 1.0,
+                    "lexical_weight": item.get("lexical_weight", 1.0) if hybrid else 0.0,
+                    "rerank": rerank,
                 }
             )
 
-        return {"answer": answer, "sources": sources, "query": query}
+        ef_values = [item["ef_search"] for item in queries if item.get("ef_search")]
+        probe_values = [item["probes"] for item in queries if item.get("probes")]
+        with stage(RAG_STAGE_SECONDS, "retrieve"):
+            retrieved = await run_in_threadpool(
+                self.run_search,
+                self.search_chunks_batch,
+                user.id,
+                searches,
+                max(ef_values) if ef_values else None,
+                max(probe_values) if probe_values else None,
+                any(item.get("mmr_lambda") is not None for item in queries),
+            )
+
+        semaphore = asyncio.Semaphore(QUERY_BATCH_CONCURRENCY)
+
+        async def answer_item(item: Dict, search: Dict, chunks: List[Dict]) -> Dict:
+            async with semaphore:
+                try:
+                    top_k = item.get("top_k", 5)
+                    if item.get("mmr_lambda") is not None:
+                        keep = reranker_service.candidate_count(top_k) if search["rerank"] else top_k
+                        chunks = self.diversify(search["embedding"], chunks, keep, item["mmr_lambda"])
+                    if search["rerank"]:
+                        chunks = await self.rerank_chunks(item["query"], chunks, top_k)
+                    result = await self.answer_from_chunks(
+                        user, item["query"], search["embedding"], chunks, item.get("use_cache", True)
+                    )
+                    result["error"] = None
+                    return result
+                except Exception as e:
+                    return {
+                        "answer": None,
+                        "sources": [],
+                        "query": item["query"],
+                        "cached": False,
+                        "context_tokens": 0,
+                        "error": str(e),
+                    }
+
+        return await asyncio.gather(
+            *[
+                answer_item(item, search, chunks)
+                for item, search, chunks in zip(queries, searches, retrieved)
+            ]
+        )
+
+    def answer_cache_scope(self, user: User, chunks: List[Dict]) -> str:
+        """Answer cache scope for a user's LLM settings and retrieved chunks"""
+        llm = self.resolve_llm(user)
+        llm_id = f"{llm['provider']}:{llm['endpoint'] or ''}:{llm['model']}"
+        chunk_ids = [
+            chunk_id
+            for chunk in chunks
+            for chunk_id in chunk.get("chunk_ids", [chunk["chunk_id"]])
+        ]
+        return answer_cache.make_scope(user.id, chunk_ids, llm_id, self.prompt_template_id)
+
+    async def query_stream(
+        self,
+        user: User,
+        query: str,
+        top_k: int = 5,
+        document_ids: Optional[List[int]] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        use_cache: bool = True,
+        retrieval_mode: Optional[str] = None,
+        vector_weight: float = 1.0,
+        lexical_weight: float = 1.0,
+        rerank: Optional[bool] = None,
+        mmr_lambda: Optional[float] = None,
+    ) -> AsyncIterator[Dict]:
+        """
+        Process RAG query, streaming the answer
+        Yields: {"event": "sources", ...} first, then {"event": "token", ...}
+        for each answer delta, then {"event": "done"}
+        """
+        with stage(RAG_STAGE_SECONDS, "embed"):
+            query_embedding = await embedding_service.aembed_text(query)
+        rerank = reranker_service.enabled if rerank is None else rerank
+        fetch_k = reranker_service.candidate_count(top_k) if rerank else top_k
+        chunks = await self.retrieve_relevant_chunks(
+            user.id, query, fetch_k, document_ids, ef_search, probes,
+            query_embedding=query_embedding,
+            retrieval_mode=retrieval_mode,
+            vector_weight=vector_weight,
+            lexical_weight=lexical_weight,
+            mmr_lambda=mmr_lambda,
+        )
+        if rerank:
+            chunks = await self.rerank_chunks(query, chunks, top_k)
+
+        if chunks:
+            chunks, context_tokens = await run_in_threadpool(self.pack_context, user, chunks)
+        else:
+            context_tokens = 0
+        yield {
+            "event": "sources",
+            "data": {
+                "sources": self.format_sources(chunks),
+                "query": query,
+                "context_tokens": context_tokens,
+            },
+        }
+
+        if not chunks:
+            yield {"event": "token", "data": {"text": NO_DOCUMENTS_ANSWER}}
+            yield {"event": "done", "data": {"cached": False}}
+            return
+
+        cache_scope = self.answer_cache_scope(user, chunks)
+        if use_cache:
+            cached = answer_cache.get(cache_scope, query, query_embedding)
+            if cached is not None:
+                yield {"event": "token", "data": {"text": cached["answer"]}}
+                yield {"event": "done", "data": {"cached": True}}
+                return
+
+        with stage(RAG_STAGE_SECONDS, "prompt"):
+            context = self.build_context(chunks)
+            prompt = self.build_prompt(query, context)
+
+        # aclosing() propagates cancellation to the upstream HTTP stream
+        answer_parts = []
+        async with aclosing(self.stream_answer(user, prompt)) as deltas:
+            async for delta in deltas:
+                answer_parts.append(delta)
+                yield {"event": "token", "data": {"text": delta}}
+
+        # Only completed streams are cached
+        answer_cache.set(
+            cache_scope, query, query_embedding, user.id,
+            [chunk["document_id"] for chunk in chunks], "".join(answer_parts),
+        )
+
+        yield {"event": "done", "data": {"cached": False}}
 
 
 # Global RAG service instance
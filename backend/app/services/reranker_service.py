@@ -0,0 +1,153 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+import asyncio
+import threading
+import time
+import os
+from dotenv import load_dotenv
+
+from app.utils import metrics
+
+load_dotenv()
+
+RERANK_SECONDS = metrics.histogram(
+    "rerank_seconds", "Duration of cross-encoder reranking calls"
+)
+RERANK_SKIPPED = metrics.counter(
+    "rerank_skipped_total",
+    "Reranking calls skipped (model loading, busy, over budget or failed)",
+    labelnames=("reason",),
+)
+
+
+class RerankerService:
+    """
+    Optional reranking of retrieved chunks with a small local cross-encoder.
+
+    Callers over-fetch candidates (candidate_count) and rerank() rescores
+    them in one batched predict call on a dedicated executor. Reranking is
+    best-effort: if the model is still loading, the executor is busy, the
+    call exceeds RERANK_BUDGET_MS or it fails, rerank() returns None and the
+    caller keeps the retrieval order.
+    """
+
+    def __init__(self, model_name: str = None, enabled: bool = None):
+        if model_name is None:
+            model_name = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+        if enabled is None:
+            enabled = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+
+        self.model_name = model_name
+        self.enabled = enabled
+        self.budget = float(os.getenv("RERANK_BUDGET_MS", "300")) / 1000.0
+        self.overfetch = max(1, int(os.getenv("RERANK_OVERFETCH", "4")))
+        self.max_candidates = int(os.getenv("RERANK_MAX_CANDIDATES", "50"))
+        self.batch_size = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+        self.model = None
+
+        self._workers = int(os.getenv("RERANK_EXECUTOR_WORKERS", "1"))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._workers, thread_name_prefix="rerank"
+        )
+        # Model loading gets its own thread so it never holds a rerank slot
+        self._warm_up_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="rerank-warm-up"
+        )
+        self._model_lock = threading.Lock()
+        self._warm_up_future: Optional[Future] = None
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+
+    @property
+    def is_ready(self) -> bool:
+        return self.model is not None
+
+    def candidate_count(self, top_k: int) -> int:
+        """Number of candidates to retrieve when reranking down to top_k"""
+        return max(top_k, min(top_k * self.overfetch, self.max_candidates))
+
+    def _load_model(self):
+        """Load the cross-encoder (once, even under concurrent first use)"""
+        with self._model_lock:
+            if self.model is not None:
+                return
+            # Deferred: imports torch
+            from sentence_transformers import CrossEncoder
+
+            self.model = CrossEncoder(self.model_name)
+            print(f"Loaded reranker model: {self.model_name}")
+
+    def warm_up(self):
+        """Load the model and run one prediction"""
+        self._load_model()
+        self.model.predict([("warm up", "warm up")])
+
+    def start_warm_up(self) -> Future:
+        """Warm the model up in the background without blocking"""
+        if self._warm_up_future is None:
+            self._warm_up_future = self._warm_up_executor.submit(self.warm_up)
+        return self._warm_up_future
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        """Cross-encoder relevance scores for (query, text) pairs (blocking)"""
+        if self.model is None:
+            self._load_model()
+        return [
+            float(score)
+            for score in self.model.predict(
+                [(query, text) for text in texts], batch_size=self.batch_size
+            )
+        ]
+
+    def _release(self, future: Future):
+        with self._in_flight_lock:
+            self._in_flight -= 1
+
+    async def rerank(
+        self, query: str, chunks: List[Dict], top_k: int
+    ) -> Optional[List[Dict]]:
+        """
+        Rescore chunks against the query and keep the best top_k
+        Returns: Reranked chunks (with a rerank_score), or None if skipped
+        """
+        if not chunks:
+            return []
+
+        if not self.is_ready:
+            # Never block a query on model loading
+            self.start_warm_up()
+            RERANK_SKIPPED.inc(reason="loading")
+            return None
+
+        # A call that overran its budget keeps running on the executor;
+        # don't queue behind it
+        with self._in_flight_lock:
+            if self._in_flight >= self._workers:
+                RERANK_SKIPPED.inc(reason="busy")
+                return None
+            self._in_flight += 1
+
+        started = time.perf_counter()
+        # Released when the work finishes (or is cancelled before starting),
+        # not when the caller stops waiting
+        future = self._executor.submit(self.score, query, [chunk["text"] for chunk in chunks])
+        future.add_done_callback(self._release)
+        try:
+            scores = await asyncio.wait_for(asyncio.wrap_future(future), self.budget)
+        except asyncio.TimeoutError:
+            RERANK_SKIPPED.inc(reason="budget")
+            print(f"Reranking skipped: exceeded {self.budget * 1000:.0f}ms budget")
+            return None
+        except Exception as e:
+            RERANK_SKIPPED.inc(reason="error")
+            print(f"Reranking skipped: {e}")
+            return None
+        finally:
+            RERANK_SECONDS.observe(time.perf_counter() - started)
+
+        ranked = sorted(zip(scores, chunks), key=lambda pair: pair[0], reverse=True)
+        return [dict(chunk, rerank_score=score) for score, chunk in ranked[:top_k]]
+
+
+# Global reranker service instance
+reranker_service = RerankerService()
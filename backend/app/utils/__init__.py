@@ -4,8 +4,12 @@ from app.utils.auth import (
     create_access_token,
     decode_token,
     get_current_user,
+    get_current_user_id,
+    get_cached_user,
     authenticate_user,
 )
+from app.utils.password_hasher import PasswordHasher, password_hasher
+from app.utils.user_cache import UserCache, user_cache
 
 __all__ = [
     "verify_password",
@@ -13,5 +17,11 @@ __all__ = [
     "create_access_token",
     "decode_token",
     "get_current_user",
+    "get_current_user_id",
+    "get_cached_user",
     "authenticate_user",
+    "PasswordHasher",
+    "password_hasher",
+    "UserCache",
+    "user_cache",
 ]
@@ -1,16 +1,18 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 import os
 from dotenv import load_dotenv
 
-from app.models.database import get_db
+from app.models.database import SessionLocal, get_db
 from app.models.user import User
 from app.schemas.user import TokenData
+from app.utils.password_hasher import pwd_context, password_hasher
+from app.utils.user_cache import user_cache
 
 load_dotenv()
 
@@ -18,7 +20,6 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
 
@@ -63,11 +64,11 @@ def decode_token(token: str) -> TokenData:
         )
 
 
-async def get_current_user(
+def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db),
 ) -> User:
-    """Get the current authenticated user"""
+    """Get the current authenticated user (loaded in this request's session, for updates)"""
     token = credentials.credentials
     token_data = decode_token(token)
 
@@ -80,11 +81,61 @@ async def get_current_user(
     return user
 
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
-    """Authenticate a user by username and password"""
-    user = db.query(User).filter(User.username == username).first()
+def get_current_user_id(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+) -> int:
+    """Get the authenticated user's id from the token alone (no database lookup)"""
+    return decode_token(credentials.credentials).user_id
+
+
+def get_cached_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+) -> User:
+    """
+    Get the current authenticated user from the user cache, loading it on a
+    miss. The returned user is detached and read-only.
+    """
+    user_id = decode_token(credentials.credentials).user_id
+
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+
+    # A session is only opened on a cache miss
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == user_id).first()
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found",
+            )
+        db.expunge(user)
+    finally:
+        db.close()
+
+    user_cache.set(user)
+    return user
+
+
+async def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
+    """
+    Authenticate a user by username and password. bcrypt runs on the
+    password hashing pool; a stored hash with outdated cost parameters is
+    replaced on success.
+    """
+    user = await run_in_threadpool(
+        lambda: db.query(User).filter(User.username == username).first()
+    )
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+
+    valid, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    if not valid:
         return None
+
+    if new_hash:
+        user.hashed_password = new_hash
+        await run_in_threadpool(db.commit)
+        user_cache.invalidate(user.id)
     return user
@@ -0,0 +1,201 @@
+"""
+Minimal in-process metrics (counters, gauges, histograms) rendered in the
+Prometheus text exposition format by GET /metrics.
+
+Metrics are per process; with several uvicorn workers each worker exposes
+its own values.
+"""
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{str(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, description, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Metric):
+    """A gauge that is set directly or read from a callback at render time"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], Dict[Tuple, float]]] = None,
+    ):
+        super().__init__(name, description, labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        values = dict(self._values)
+        if self.callback is not None:
+            try:
+                values.update(self.callback())
+            except Exception:
+                pass
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label values -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def snapshot(self, **labels) -> Dict:
+        """Count, sum and cumulative bucket counts for one label set"""
+        with self._lock:
+            state = list(self._values.get(self._key(labels), [0] * len(self.buckets) + [0.0, 0]))
+        return {
+            "count": state[-1],
+            "sum": state[-2],
+            "buckets": dict(zip(self.buckets, state[: len(self.buckets)])),
+        }
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        for key, state in items:
+            for bound, count in zip(self.buckets, state):
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            # Re-registering a name returns the existing metric
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Global metrics registry
+registry = MetricsRegistry()
+
+
+def counter(name: str, description: str, labelnames: Sequence[str] = ()) -> Counter:
+    return registry.register(Counter(name, description, labelnames))
+
+
+def gauge(
+    name: str,
+    description: str,
+    labelnames: Sequence[str] = (),
+    callback: Optional[Callable[[], Dict[Tuple, float]]] = None,
+) -> Gauge:
+    return registry.register(Gauge(name, description, labelnames, callback))
+
+
+def histogram(
+    name: str,
+    description: str,
+    labelnames: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_BUCKETS,
+) -> Histogram:
+    return registry.register(Histogram(name, description, labelnames, buckets))
+
+
+# Shared by the answer and embedding caches
+CACHE_LOOKUPS = counter(
+    "cache_lookups_total",
+    "Answer and embedding cache lookups by result",
+    labelnames=("cache", "result"),
+)
@@ -0,0 +1,127 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+import asyncio
+import threading
+import time
+import os
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app.utils import metrics
+
+load_dotenv()
+
+PASSWORD_HASH_SECONDS = metrics.histogram(
+    "password_hash_seconds",
+    "Time spent hashing or verifying a password (excluding queue wait)",
+    labelnames=("operation",),
+)
+PASSWORD_HASH_QUEUE_WAIT_SECONDS = metrics.histogram(
+    "password_hash_queue_wait_seconds",
+    "Time password operations waited for a hashing worker",
+)
+PASSWORD_HASH_REJECTED = metrics.counter(
+    "password_hash_rejected_total",
+    "Password operations rejected with 429 because the hashing queue was full",
+)
+PASSWORD_REHASHED = metrics.counter(
+    "password_rehashed_total",
+    "Password hashes upgraded on login after the cost parameters changed",
+)
+
+# Cost factor for new hashes; stored hashes with a different cost are
+# rehashed on the next successful login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS
+)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a small dedicated executor so login and registration
+    bursts can't take over the request threadpool (each verify costs ~200ms
+    of CPU at the default cost).
+
+    At most PASSWORD_HASH_WORKERS operations run at once and
+    PASSWORD_HASH_MAX_QUEUE more may wait; beyond that callers get a 429
+    with Retry-After instead of piling up behind the queue.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_queue: Optional[int] = None):
+        if workers is None:
+            workers = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+        if max_queue is None:
+            max_queue = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = int(os.getenv("PASSWORD_HASH_RETRY_AFTER_SECONDS", "1"))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="password-hash"
+        )
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+        metrics.gauge(
+            "password_hash_pending",
+            "Password operations running or queued on the hashing pool",
+            callback=lambda: {(): self._pending},
+        )
+
+    def _timed(self, operation: str, enqueued_at: float, fn, *args):
+        """Run fn on a hashing worker, recording queue wait and work time"""
+        started = time.perf_counter()
+        PASSWORD_HASH_QUEUE_WAIT_SECONDS.observe(started - enqueued_at)
+        try:
+            return fn(*args)
+        finally:
+            PASSWORD_HASH_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+    async def _submit(self, operation: str, fn, *args):
+        with self._pending_lock:
+            if self._pending >= self.workers + self.max_queue:
+                PASSWORD_HASH_REJECTED.inc()
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many authentication requests, please retry shortly",
+                    headers={"Retry-After": str(self.retry_after)},
+                )
+            self._pending += 1
+
+        # Released when the work finishes (or is cancelled before starting),
+        # not when the caller stops waiting
+        future = self._executor.submit(self._timed, operation, time.perf_counter(), fn, *args)
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, future):
+        with self._pending_lock:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        """Hash a password"""
+        return await self._submit("hash", pwd_context.hash, password)
+
+    async def verify_and_update(
+        self, password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        Verify a password against its hash
+        Returns: (valid, new hash if the stored one should be replaced)
+        """
+        valid, new_hash = await self._submit(
+            "verify", pwd_context.verify_and_update, password, hashed_password
+        )
+        if valid and new_hash:
+            PASSWORD_REHASHED.inc()
+        return valid, new_hash
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Global password hasher instance
+password_hasher = PasswordHasher()
@@ -0,0 +1,76 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, Optional
+import time
+
+
+class StageTimings:
+    """Seconds spent per named stage, accumulated over one request or job"""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def get(self, name: str) -> float:
+        return self.stages.get(name, 0.0)
+
+    @contextmanager
+    def measure(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def server_timing(self) -> str:
+        """Render as a Server-Timing header value (durations in ms)"""
+        return ", ".join(
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()
+        )
+
+
+# Timings of the request being handled; set by the request middleware in
+# app/main.py and None outside a request (e.g. background ingestion)
+request_timings: ContextVar[Optional[StageTimings]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+@contextmanager
+def stage(histogram, name: str):
+    """Time a block into histogram{stage=name} and the current request's timings"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed, stage=name)
+        timings = request_timings.get()
+        if timings is not None:
+            timings.add(name, elapsed)
+
+
+def timed_iter(
+    iterable: Iterable, timings: StageTimings, name: str, exclude: Optional[str] = None
+) -> Iterator:
+    """
+    Yield from iterable, adding the time spent producing each item to a stage.
+    When iterable pulls from another timed_iter, pass that stage as exclude
+    so its time is not counted twice.
+    """
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        excluded_before = timings.get(exclude) if exclude else 0.0
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            elapsed = time.perf_counter() - started
+            if exclude:
+                elapsed -= timings.get(exclude) - excluded_before
+            timings.add(name, elapsed)
+        yield item
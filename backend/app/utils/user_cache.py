@@ -0,0 +1,76 @@
+from collections import OrderedDict
+from typing import Optional
+import threading
+import time
+import os
+from dotenv import load_dotenv
+
+from app.models.user import User
+
+load_dotenv()
+
+
+class UserCache:
+    """
+    Short-TTL, process-local cache of authenticated users, keyed by user id.
+
+    Cached users are detached from their session and must be treated as
+    read-only. Updates in this process invalidate the entry explicitly;
+    other uvicorn workers pick changes up when their entry expires
+    (USER_CACHE_TTL_SECONDS).
+    """
+
+    def __init__(self, max_size: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        if max_size is None:
+            max_size = int(os.getenv("USER_CACHE_SIZE", "10000"))
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl_seconds > 0
+
+    def get(self, user_id: int) -> Optional[User]:
+        """Look up a user; returns None on a miss"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def set(self, user: User):
+        """Store a detached user"""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl_seconds, user)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        """Drop a user's entry (after their record changes)"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Global user cache instance
+user_cache = UserCache()
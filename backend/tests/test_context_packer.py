@@ -0,0 +1,83 @@
+"""
+Tests for packing retrieved chunks into the context budget. Token counts
+use the len/4 approximation, so no tiktoken files are needed.
+"""
+import pytest
+
+from app.services.context_packer import ContextPacker, merge_overlapping
+
+
+def chunk(chunk_id, text, document_id=1, page_number=1, chunk_index=None, similarity=0.5):
+    return {
+        "chunk_id": chunk_id,
+        "document_id": document_id,
+        "page_number": page_number,
+        "chunk_index": chunk_id if chunk_index is None else chunk_index,
+        "text": text,
+        "similarity": similarity,
+    }
+
+
+@pytest.fixture
+def packer(monkeypatch):
+    packer = ContextPacker()
+    packer.budgets = {}
+    packer.default_budget = 100
+    packer.min_block_tokens = 10
+    monkeypatch.setattr(packer, "_encoding", lambda model: None)
+    return packer
+
+
+def test_merge_overlapping_drops_shared_text():
+    assert merge_overlapping("the quick brown fox", "brown fox jumps") == "the quick brown fox jumps"
+    assert merge_overlapping("no overlap here", "at all") == "no overlap here at all"
+
+
+def test_merge_adjacent_joins_consecutive_chunks_in_rank_order(packer):
+    chunks = [
+        chunk(5, "other document", document_id=2, chunk_index=0, similarity=0.9),
+        chunk(2, "second part of the page", similarity=0.7),
+        chunk(1, "first part of the page, second part", similarity=0.6),
+        chunk(4, "a later chunk on the page", similarity=0.3),
+    ]
+    blocks = packer.merge_adjacent(chunks)
+
+    assert [block["chunk_ids"] for block in blocks] == [[5], [1, 2], [4]]
+    merged = blocks[1]
+    assert merged["text"] == "first part of the page, second part of the page"
+    assert merged["similarity"] == 0.7
+
+
+def test_merge_adjacent_keeps_pages_apart(packer):
+    blocks = packer.merge_adjacent(
+        [chunk(1, "end of page one"), chunk(2, "start of page two", page_number=2)]
+    )
+    assert [block["chunk_ids"] for block in blocks] == [[1], [2]]
+
+
+def test_pack_dedupes_and_respects_budget(packer):
+    chunks = [
+        chunk(1, "a" * 200, similarity=0.9),
+        chunk(10, "A" * 50, chunk_index=20, similarity=0.8),  # contained in chunk 1
+        chunk(30, "b" * 200, chunk_index=40, similarity=0.7),
+        chunk(50, "c" * 200, chunk_index=60, similarity=0.6),
+    ]
+    blocks, used = packer.pack(chunks)
+
+    assert [block["chunk_ids"] for block in blocks] == [[1], [30]]
+    assert used == 100
+
+
+def test_pack_truncates_block_that_does_not_fit(packer):
+    blocks, used = packer.pack([chunk(1, "a" * 200), chunk(5, "b" * 400, chunk_index=9)])
+
+    assert blocks[1]["text"] == "b" * 200
+    assert used == 100
+
+
+def test_pack_counts_headers_against_budget(packer):
+    format_block = lambda number, block: f"[Source {number}]\n{block['text']}"
+    blocks, used = packer.pack([chunk(1, "a" * 1000)], format_block=format_block)
+
+    assert used <= 100
+    assert blocks[0]["text"].startswith("a")
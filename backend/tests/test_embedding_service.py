@@ -0,0 +1,56 @@
+"""
+Tests for the embedding server client, against a fake server transport
+"""
+import json
+
+import httpx
+import numpy as np
+import pytest
+
+from app.services.embedding_service import EmbeddingService
+
+
+def client_for(server_model_id):
+    """An EmbeddingService whose embedding server runs server_model_id"""
+
+    def handler(request):
+        if request.url.path == "/health":
+            return httpx.Response(503, json={"status": "loading", "model_id": server_model_id})
+        embeddings = np.ones((len(json.loads(request.content)["texts"]), 3), dtype=np.float32)
+        return httpx.Response(
+            200,
+            content=embeddings.tobytes(),
+            headers={"X-Embedding-Dimension": "3", "X-Embedding-Model": server_model_id},
+        )
+
+    service = EmbeddingService(model_name="mini", backend="onnx", server_url="http://embeddings")
+    service._server_client = httpx.Client(
+        transport=httpx.MockTransport(handler), base_url="http://embeddings"
+    )
+    return service
+
+
+def test_matching_server_model_is_accepted():
+    service = client_for("mini:onnx")
+    service.verify_server_model()
+    assert service.encode(["a", "b"]) == [[1.0, 1.0, 1.0], [1.0, 1.0, 1.0]]
+
+
+def test_mismatched_server_model_is_refused():
+    service = client_for("mini:torch")
+    with pytest.raises(Exception, match="serves mini:torch"):
+        service.verify_server_model()
+    with pytest.raises(Exception, match="serves mini:torch"):
+        service.encode(["a"])
+
+
+def test_unreachable_server_is_checked_later():
+    service = EmbeddingService(model_name="mini", backend="onnx", server_url="http://embeddings")
+
+    def refuse(request):
+        raise httpx.ConnectError("connection refused")
+
+    service._server_client = httpx.Client(
+        transport=httpx.MockTransport(refuse), base_url="http://embeddings"
+    )
+    service.verify_server_model()
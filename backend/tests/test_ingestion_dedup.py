@@ -0,0 +1,104 @@
+"""
+Tests for upload and chunk embedding reuse in IngestionService, with a
+fake session standing in for PostgreSQL
+"""
+from types import SimpleNamespace
+
+from app.models.document import Document
+from app.services.embedding_service import embedding_service
+from app.services.ingestion_service import IngestionService
+
+
+class FakeQuery:
+    """Chainable query returning fixed rows"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter(self, *criteria):
+        return self
+
+    def order_by(self, *columns):
+        return self
+
+    def distinct(self, *columns):
+        return self
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    def __init__(self, rows=(), rowcount=0):
+        self.rows = list(rows)
+        self.rowcount = rowcount
+        self.statements = []
+        self.committed = False
+        self.rolled_back = False
+
+    def query(self, *entities):
+        return FakeQuery(self.rows)
+
+    def execute(self, statement):
+        self.statements.append(statement)
+        return SimpleNamespace(rowcount=self.rowcount)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+def upload():
+    return Document(id=2, user_id=7, content_hash="abc", ingest_signature="sig", chunks_processed=0)
+
+
+def test_copy_duplicate_copies_all_chunks():
+    db = FakeSession(rows=[SimpleNamespace(id=1, chunks_total=3)], rowcount=3)
+    document = upload()
+
+    assert IngestionService().copy_duplicate(db, document) is True
+    assert db.committed and not db.rolled_back
+    assert (document.chunks_total, document.chunks_processed, document.chunk_count) == (3, 3, 3)
+    sql = str(db.statements[0])
+    assert sql.startswith("INSERT INTO document_chunks") and "SELECT" in sql
+
+
+def test_copy_duplicate_rolls_back_partial_copy():
+    # The source lost chunks (deleted or re-processed) between the lookup and the copy
+    db = FakeSession(rows=[SimpleNamespace(id=1, chunks_total=3)], rowcount=2)
+    document = upload()
+
+    assert IngestionService().copy_duplicate(db, document) is False
+    assert db.rolled_back and not db.committed
+    assert document.chunks_total is None
+
+
+def test_copy_duplicate_without_source():
+    db = FakeSession(rows=[])
+    assert IngestionService().copy_duplicate(db, upload()) is False
+    assert db.statements == []
+
+
+def test_embed_batch_reuses_stored_embeddings(monkeypatch):
+    encoded = []
+
+    def embed_texts(texts):
+        encoded.extend(texts)
+        return [[float(len(text))] for text in texts]
+
+    monkeypatch.setattr(embedding_service, "embed_texts", embed_texts)
+    db = FakeSession(rows=[("h1", [0.5])])
+
+    results = IngestionService().embed_batch(db, ["one", "three", "one"], ["h1", "h3", "h1"])
+
+    assert encoded == ["three"]
+    assert results == [
+        {"embedding": [0.5], "reused": True},
+        {"embedding": [5.0], "reused": False},
+        {"embedding": [0.5], "reused": True},
+    ]
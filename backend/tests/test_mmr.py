@@ -0,0 +1,23 @@
+"""
+Tests for maximal marginal relevance selection
+"""
+from app.services.mmr import mmr_select
+
+QUERY = [1.0, 0.0]
+# Two near-duplicates closest to the query, and a less relevant but
+# different candidate
+CANDIDATES = [[1.0, 0.05], [1.0, 0.06], [0.7, -0.7]]
+
+
+def test_pure_relevance_keeps_similarity_order():
+    assert mmr_select(QUERY, CANDIDATES, 3, lambda_mult=1.0) == [0, 1, 2]
+
+
+def test_diversity_skips_near_duplicates():
+    assert mmr_select(QUERY, CANDIDATES, 2, lambda_mult=0.5) == [0, 2]
+
+
+def test_top_k_bounds():
+    assert mmr_select(QUERY, CANDIDATES, 0) == []
+    assert mmr_select(QUERY, [], 3) == []
+    assert sorted(mmr_select(QUERY, CANDIDATES, 10)) == [0, 1, 2]
@@ -0,0 +1,62 @@
+"""
+Tests for the bounded password hashing pool
+"""
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from app.utils.password_hasher import PasswordHasher
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    hasher = PasswordHasher(workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def run():
+        # One operation runs and one waits; the third has no room
+        accepted = [
+            asyncio.ensure_future(hasher._submit("hash", release.wait, 5)) for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as rejected:
+            await hasher._submit("hash", release.wait, 5)
+        assert rejected.value.status_code == 429
+        assert rejected.value.headers == {"Retry-After": str(hasher.retry_after)}
+
+        release.set()
+        assert await asyncio.gather(*accepted) == [True, True]
+        assert hasher._pending == 0
+        assert await hasher._submit("hash", lambda: "accepted again") == "accepted again"
+
+    try:
+        asyncio.run(run())
+    finally:
+        release.set()
+        hasher.shutdown()
+
+
+def test_cancelled_caller_keeps_slot_until_work_finishes():
+    hasher = PasswordHasher(workers=1, max_queue=0)
+    release = threading.Event()
+
+    async def run():
+        caller = asyncio.ensure_future(hasher._submit("verify", release.wait, 5))
+        await asyncio.sleep(0.05)
+        caller.cancel()
+        await asyncio.sleep(0)
+        # bcrypt is still running on the worker, so the slot is still taken
+        assert hasher._pending == 1
+        release.set()
+        for _ in range(100):
+            if hasher._pending == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert hasher._pending == 0
+
+    try:
+        asyncio.run(run())
+    finally:
+        release.set()
+        hasher.shutdown()
@@ -0,0 +1,59 @@
+"""
+Tests for the reranker's executor slot accounting, with a fake model
+"""
+import asyncio
+import threading
+
+from app.services.reranker_service import RerankerService
+
+
+class SlowModel:
+    """Stands in for a CrossEncoder; predict blocks until released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def predict(self, pairs, batch_size=32):
+        self.release.wait(5)
+        return [float(len(text)) for _, text in pairs]
+
+
+def test_slot_is_held_until_overrunning_call_finishes():
+    reranker = RerankerService(enabled=True)
+    reranker.model = SlowModel()
+    reranker.budget = 0.05
+    chunks = [{"text": "a"}, {"text": "bbb"}]
+
+    async def run():
+        assert await reranker.rerank("q", chunks, 1) is None  # over budget
+        assert reranker._in_flight == 1
+        assert await reranker.rerank("q", chunks, 1) is None  # busy
+        reranker.model.release.set()
+        await asyncio.sleep(0.1)
+        assert reranker._in_flight == 0
+
+        reranker.budget = 5
+        ranked = await reranker.rerank("q", chunks, 1)
+        assert [chunk["text"] for chunk in ranked] == ["bbb"]
+        assert reranker._in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_warm_up_does_not_take_a_rerank_slot():
+    reranker = RerankerService(enabled=True)
+    loading = threading.Event()
+    finish = threading.Event()
+
+    def slow_warm_up():
+        loading.set()
+        finish.wait(5)
+
+    reranker.warm_up = slow_warm_up
+    reranker.start_warm_up()
+    assert loading.wait(5)
+
+    # The rerank executor is still free while the model loads
+    assert reranker._executor.submit(lambda: "free").result(timeout=1) == "free"
+    assert reranker._in_flight == 0
+    finish.set()
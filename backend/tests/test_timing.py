@@ -0,0 +1,22 @@
+"""
+Tests for stage timing helpers
+"""
+import time
+
+from app.utils.timing import StageTimings, timed_iter
+
+
+def slow(items, seconds):
+    for item in items:
+        time.sleep(seconds)
+        yield item
+
+
+def test_chained_stages_are_not_counted_twice():
+    timings = StageTimings()
+    pages = timed_iter(slow(["a", "b"], 0.05), timings, "extract")
+    chunks = timed_iter(slow(pages, 0.01), timings, "chunk", exclude="extract")
+
+    assert list(chunks) == ["a", "b"]
+    assert timings.get("extract") >= 0.1
+    assert 0.02 <= timings.get("chunk") < 0.06
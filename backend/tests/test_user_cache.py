@@ -0,0 +1,83 @@
+"""
+Tests for the authenticated-user cache and its invalidation on updates
+"""
+from datetime import datetime
+import importlib
+
+import pytest
+
+from app.models.user import User
+from app.routers.users import update_user
+from app.schemas.user import UserUpdate
+from app.utils.user_cache import UserCache, user_cache
+
+# app.utils re-exports the user_cache instance under the module's name
+user_cache_module = importlib.import_module("app.utils.user_cache")
+
+
+class FakeSession:
+    def __init__(self):
+        self.committed = False
+
+    def commit(self):
+        self.committed = True
+
+    def refresh(self, instance):
+        pass
+
+
+def make_user(user_id=1):
+    return User(
+        id=user_id,
+        username=f"user{user_id}",
+        created_at=datetime(2024, 1, 1),
+        preferred_llm_provider="openai",
+        preferred_model="gpt-3.5-turbo",
+    )
+
+
+def test_entries_expire_and_are_evicted(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(user_cache_module.time, "monotonic", lambda: now[0])
+    cache = UserCache(max_size=2, ttl_seconds=30)
+
+    for user_id in (1, 2, 3):
+        cache.set(make_user(user_id))
+    assert cache.get(1) is None  # least recently used
+    assert cache.get(3).username == "user3"
+
+    now[0] += 31
+    assert cache.get(3) is None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = UserCache(max_size=0, ttl_seconds=30)
+    cache.set(make_user())
+    assert cache.get(1) is None
+
+
+@pytest.fixture
+def cached_user(monkeypatch):
+    monkeypatch.setattr(user_cache, "max_size", 10)
+    monkeypatch.setattr(user_cache, "ttl_seconds", 30)
+    user = make_user()
+    user_cache.set(user)
+    yield user
+    user_cache.clear()
+
+
+def test_update_user_invalidates_cached_user(cached_user):
+    db = FakeSession()
+    response = update_user(UserUpdate(preferred_model="gpt-4o"), current_user=cached_user, db=db)
+
+    assert db.committed
+    assert response.preferred_model == "gpt-4o"
+    assert user_cache.get(cached_user.id) is None
+
+
+def test_rejected_update_keeps_cached_user(cached_user):
+    with pytest.raises(Exception):
+        update_user(
+            UserUpdate(preferred_llm_provider="unknown"), current_user=cached_user, db=FakeSession()
+        )
+    assert user_cache.get(cached_user.id) is cached_user
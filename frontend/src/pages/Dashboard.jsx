@@ -17,10 +17,26 @@ function Dashboard() {
     loadDocuments();
   }, []);
 
+  // Poll while any document is still being processed in the background
+  useEffect(() => {
+    const inProgress = documents.some((doc) => doc.processed === 0 || doc.processed === 1);
+    if (!inProgress) return;
+
+    const timer = setTimeout(loadDocuments, 3000);
+    return () => clearTimeout(timer);
+  }, [documents]);
+
   const loadDocuments = async () => {
     try {
-      const response = await documentsAPI.list();
-      setDocuments(response.data);
+      // Follow the pagination cursor until all documents are loaded
+      const allDocuments = [];
+      let cursor;
+      do {
+        const response = await documentsAPI.list(cursor ? { cursor } : undefined);
+        allDocuments.push(...response.data);
+        cursor = response.headers['x-next-cursor'];
+      } while (cursor);
+      setDocuments(allDocuments);
     } catch (error) {
       console.error('Failed to load documents:', error);
     }
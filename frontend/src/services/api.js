@@ -42,8 +42,10 @@ export const documentsAPI = {
       onUploadProgress,
     });
   },
-  list: () => api.get('/documents/'),
+  // Pass { cursor } from the X-Next-Cursor header of the previous page
+  list: (params) => api.get('/documents/', { params }),
   get: (id) => api.get(`/documents/${id}`),
+  status: (id) => api.get(`/documents/${id}/status`),
   delete: (id) => api.delete(`/documents/${id}`),
 };
 